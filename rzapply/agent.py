@@ -4,38 +4,204 @@ import argparse
 import asyncio
 import base64
 import contextlib
-import json
 import os
 import platform
+import queue
+import random
 import shutil
 import threading
 import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
-import requests
+import httpx
+import orjson
 import websockets
 
+try:  # uvloop 仅支持类 Unix 平台, Windows 上回退到默认事件循环
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None
+
 from task_loader import TaskLoader
 from uploader import TaskUploader, ensure_storage_state_file
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 STATE_FILE = PROJECT_ROOT / "agent_state.json"
 RUNTIME_ROOT = Path(os.environ.get("RZAPPLY_AGENT_RUNTIME", PROJECT_ROOT / "agent_runtime"))
-EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("RZAPPLY_AGENT_WORKERS", "1")))
-# Dedicated executor for running synchronous uploader code when caller is inside an asyncio loop.
-# This prevents calling Playwright's sync API from a thread that has a running asyncio event loop.
-UPLOADER_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("RZAPPLY_UPLOADER_WORKERS", "1")))
 
 
+class _WorkStealingExecutor(Executor):
+    """Thread pool where every worker owns a deque; idle workers steal from the other end of a sibling's deque.
+
+    Submission only appends to one worker's deque (atomic under the GIL), so the WS
+    thread never contends on a shared queue lock. A semaphore counts queued items so
+    idle workers sleep instead of spinning. At most ``max_pending`` items may wait;
+    beyond that ``submit`` raises ``queue.Full`` so the caller can hand the task back.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int = 2) -> None:
+        self._queues: list[deque] = [deque() for _ in range(max(max_workers, 1))]
+        self._available = threading.Semaphore(0)
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._worker, args=(index,), name=f"agent-worker-{index}", daemon=True)
+            for index in range(len(self._queues))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        if self._shutdown:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        if not self._slots.acquire(blocking=False):
+            raise queue.Full
+        future: Future = Future()
+        # 按提交线程固定投递到某个 worker, 其余 worker 空闲时自行窃取
+        self._queues[threading.get_ident() % len(self._queues)].append((future, fn, args, kwargs))
+        self._available.release()
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._shutdown = True
+        if cancel_futures:
+            for own in self._queues:
+                while own:
+                    with contextlib.suppress(IndexError):
+                        own.pop()[0].cancel()
+                        self._slots.release()
+        for _ in self._threads:
+            self._available.release()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _take(self, index: int) -> Optional[tuple]:
+        with contextlib.suppress(IndexError):
+            return self._queues[index].popleft()
+        count = len(self._queues)
+        for offset in range(1, count):
+            with contextlib.suppress(IndexError):
+                return self._queues[(index + offset) % count].pop()
+        return None
+
+    def _worker(self, index: int) -> None:
+        while True:
+            self._available.acquire()
+            # 每个许可都对应一个已入队的任务; 扫描时恰好被别的 worker 抢走就再扫一遍
+            item = self._take(index)
+            while item is None and not self._shutdown:
+                item = self._take(index)
+            if item is None:
+                return
+            self._slots.release()
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:  # noqa: BLE001
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+EXECUTOR = _WorkStealingExecutor(
+    max_workers=int(os.environ.get("RZAPPLY_AGENT_WORKERS", "1")),
+    max_pending=int(os.environ.get("RZAPPLY_AGENT_MAX_PENDING", "2")),
+)
+# Fetches task archives while the worker thread warms up the browser for the same task.
+ARCHIVE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RZAPPLY_AGENT_WORKERS", "1")), thread_name_prefix="agent-archive"
+)
+# Keep-alive pool shared by heartbeat, long-poll, result upload and archive download;
+# failed connection attempts are retried by the transport before surfacing an error.
+HTTP_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=4, keepalive_expiry=120)
+HTTP_CONNECT_RETRIES = 3
+# Overloaded / restarting server responses that are retried by _post_json (honouring Retry-After).
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+HTTP_STATUS_RETRIES = 5
+HTTP_RETRY_BACKOFF = 0.5
+# Task archives are already compressed; stream them to disk in large chunks without re-decoding.
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Archive downloads fail fast on connect but may take a while to stream.
+DOWNLOAD_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+# 单条 WebSocket 消息上限; 服务端只内联不超过该值的 ZIP (RZAPPLY_WS_INLINE_ZIP_BYTES),
+# 更大的改走 zip_url 下载
+WS_MAX_MESSAGE_BYTES = 10_000_000
+# Downloads larger than this are refused before (Content-Length) or while streaming.
+MAX_ARCHIVE_BYTES = int(os.environ.get("RZAPPLY_AGENT_MAX_ZIP_BYTES", str(512 << 20)))
+# Legacy base64 payloads are decoded in slices of this many characters (must stay a multiple of 4).
+BASE64_CHUNK_SIZE = 4 << 18
+# Number of trailing log lines kept per task and sent back with the result.
+TASK_LOG_LIMIT = 5000
+# Finished run directories are removed by a background janitor so workers can take the next task at once.
+_CLEANUP_Q: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+_CLEANUP_STARTED = threading.Lock()
+_cleanup_thread: Optional[threading.Thread] = None
+
+
+def _cleanup_worker() -> None:
+    while True:
+        path = _CLEANUP_Q.get()
+        # shutil.rmtree already walks with os.scandir + dir_fd/unlinkat where the platform supports it
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _schedule_cleanup(path: str) -> None:
+    global _cleanup_thread
+    with _CLEANUP_STARTED:
+        if _cleanup_thread is None:
+            _cleanup_thread = threading.Thread(target=_cleanup_worker, name="agent-cleanup", daemon=True)
+            _cleanup_thread.start()
+    _CLEANUP_Q.put(path)
+
+
+_TRUE_VALUES = frozenset({"1", "true", "yes", "on"})
+_FALSE_VALUES = frozenset({"0", "false", "no", "off"})
+
+
+@lru_cache(maxsize=32)
 def _env_bool(name: str, default: bool) -> bool:
+    # 环境变量在进程运行期间视为不变, 结果按 (name, default) 缓存
     value = os.environ.get(name)
     if value is None:
         return default
-    return value.strip().lower() in {"1", "true", "yes", "on"}
+    return value.strip().lower() in _TRUE_VALUES
+
+
+# (epoch second, formatted) — replaced as a whole tuple so readers on other threads never see a torn pair
+_TS_CACHE: tuple[int, str] = (0, "")
+
+
+def _timestamp() -> str:
+    """Local "%Y-%m-%d %H:%M:%S" timestamp, formatted at most once per second."""
+    global _TS_CACHE
+    now = int(time.time())
+    cached = _TS_CACHE
+    if cached[0] == now:
+        return cached[1]
+    text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    _TS_CACHE = (now, text)
+    return text
+
+
+def _backoff_delay(base: float, fail_streak: int, cap: float = 60.0) -> float:
+    """Exponential backoff with jitter for consecutive failures, capped at max(cap, base)."""
+    delay = min(max(cap, base), base * (2 ** min(fail_streak, 16)))
+    return delay + random.uniform(0, base)
+
+
+def _ws_frame(message: Dict[str, Any]) -> str:
+    """Encode a WebSocket message; the server reads JSON from text frames."""
+    return orjson.dumps(message).decode("utf-8")
 
 
 def _coerce_bool(value: Any, default: bool | None = None) -> bool | None:
@@ -45,13 +211,40 @@ def _coerce_bool(value: Any, default: bool | None = None) -> bool | None:
         return value
     if isinstance(value, str):
         value = value.strip().lower()
-        if value in {"1", "true", "yes", "on"}:
+        if value in _TRUE_VALUES:
             return True
-        if value in {"0", "false", "no", "off"}:
+        if value in _FALSE_VALUES:
             return False
     return bool(value)
 
 
+def make_http_client(headers: Mapping[str, str], read_timeout: float, *, asynchronous: bool = False):
+    """Build the agent's httpx client: shared pool limits, connect retries and a short connect timeout."""
+    timeout = httpx.Timeout(10.0, connect=5.0, read=float(read_timeout))
+    if asynchronous:
+        transport = httpx.AsyncHTTPTransport(limits=HTTP_LIMITS, retries=HTTP_CONNECT_RETRIES)
+        return httpx.AsyncClient(headers=headers, timeout=timeout, transport=transport)
+    transport = httpx.HTTPTransport(limits=HTTP_LIMITS, retries=HTTP_CONNECT_RETRIES)
+    return httpx.Client(headers=headers, timeout=timeout, transport=transport)
+
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _url_origin(url: str) -> tuple[str, str, int | None]:
+    """(scheme, host, port) of ``url`` with the scheme's default port filled in, for same-origin checks."""
+    parts = urlparse(url)
+    scheme = parts.scheme.lower()
+    return scheme, (parts.hostname or "").lower(), parts.port or _DEFAULT_PORTS.get(scheme)
+
+
+def _retry_after(response: httpx.Response, attempt: int) -> float:
+    value = response.headers.get("Retry-After")
+    if value and value.isdigit():
+        return min(float(value), 60.0)
+    return HTTP_RETRY_BACKOFF * (2**attempt)
+
+
 class TaskAgent:
     """Long-running worker that registers at a server and executes tasks sequentially."""
 
@@ -71,116 +264,209 @@ class TaskAgent:
         self.server_url = server_url.rstrip("/")
         self.token = token or os.environ.get("RZAPPLY_AGENT_TOKEN") or ""
         self.heartbeat_interval = max(heartbeat_interval, 5)
+        # 状态未变化时心跳最长间隔；保持在 2 倍周期内，服务端仍能及时感知离线
+        self.heartbeat_max_interval = self.heartbeat_interval * 2
         self.poll_interval = max(poll_interval, 5)
         self.long_poll_timeout = max(long_poll_timeout, 10)
-        self.session = requests.Session()
+        self._persisted_client_id: Optional[str] = None
+        # 端点与请求头在运行期间不变, 初始化时一次性拼好
+        self._endpoints = {
+            path: f"{self.server_url}{path}" for path in ("/register", "/heartbeat", "/task", "/task_result")
+        }
+        # 令牌不放进客户端默认头: zip_url 可能指向第三方地址,
+        # Authorization 只随发往本服务端的请求携带
+        self._headers: Mapping[str, str] = MappingProxyType({"Content-Type": "application/json"})
+        self._auth_headers: Mapping[str, str] = MappingProxyType(self._request_headers())
+        self._server_origin = _url_origin(self.server_url)
+        # 与服务端的 JSON 交互都走事件循环上的 AsyncClient;
+        # 这个同步客户端只给工作线程下载任务包
+        self.session = make_http_client(self._headers, self.long_poll_timeout)
         self.client_id = self._load_client_id()
         self._status = "idle"
         self._current_task_id: str | None = None
         self._stop_event = threading.Event()
         self._status_lock = threading.Lock()
+        self._hb_static = b""
+        self._hb_timer: Optional[asyncio.TimerHandle] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hb_wakeup: Optional[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = None
+        self._ws: Optional[websockets.WebSocketClientProtocol] = None
+        self._ws_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws_out: Optional["asyncio.Queue[str]"] = None
+        self._ws_sender: Optional[asyncio.Task] = None
+        # 事件循环只弱引用任务, 后台发出的请求在这里持有引用直到完成
+        self._bg_tasks: set[asyncio.Task] = set()
+        # 标记 zip_binary 的任务按顺序等待各自紧随的二进制帧
+        self._awaiting_archive: "deque[Dict[str, Any]]" = deque()
+        self._ws_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            "task": self._on_ws_task,
+            "task_batch": self._on_ws_task_batch,
+            "heartbeat": self._on_ws_heartbeat,
+            "heartbeat_ack": self._on_ws_heartbeat_ack,
+            "result": self._on_ws_result,
+            "register_ack": self._on_ws_register_ack,
+        }
         self.headless = (
             headless
             if headless is not None
             else _env_bool("RZAPPLY_AGENT_HEADLESS", _env_bool("RZAPPLY_HEADLESS", False))
         )
+        # 主机信息在进程生命周期内不变, 只在启动时采集一次 (platform.platform() 等调用较慢)
+        self._host_info = {
+            "hostname": platform.node(),
+            "platform": platform.platform(),
+            "python_version": platform.python_version(),
+            # 空闲时最长隔这么久才发一次心跳, 服务端据此判断多久未心跳算失联
+            "heartbeat_interval": self.heartbeat_max_interval,
+        }
 
         RUNTIME_ROOT.mkdir(parents=True, exist_ok=True)
+        # 每个任务的运行目录用字符串路径拼接, 避免在任务热路径上反复构造 Path
+        self._runtime_root = str(RUNTIME_ROOT)
         ensure_storage_state_file()
 
     # ------------------------------------------------------------------ public API
     def run(self) -> None:
         self._log(f"Agent starting (headless={self.headless})")
-        reg_info = self._register()
-        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
-        heartbeat_thread.start()
-
-        # If server supports WebSocket, prefer WS mode; otherwise fall back to HTTP long-polling
-        ws_thread = None
         try:
+            asyncio.run(self._run_async(), loop_factory=uvloop.new_event_loop if uvloop else None)
+        except KeyboardInterrupt:
+            self._log("Received Ctrl+C, shutting down...")
+        finally:
+            self._stop_event.set()
+
+    async def _run_async(self) -> None:
+        """Register, then run WS mode or HTTP long-polling; all server traffic shares one AsyncClient."""
+        async with make_http_client(self._headers, self.long_poll_timeout, asynchronous=True) as client:
+            self._client = client
+            self._loop = asyncio.get_running_loop()
+            reg_info = await self._register()
+
+            # If server supports WebSocket, prefer WS mode; otherwise fall back to HTTP long-polling.
+            # Either way all network I/O runs on this event loop; tasks go to EXECUTOR.
             if reg_info and isinstance(reg_info, dict) and reg_info.get("supports_ws") and reg_info.get("ws_url"):
                 ws_url = reg_info.get("ws_url")
                 self._log(f"Attempting WebSocket connection to {ws_url}")
-                ws_thread = threading.Thread(target=self._ws_thread_entry, args=(ws_url,), daemon=True)
-                ws_thread.start()
-
-                # 主线程在此等待，直到收到停止信号（例如 Ctrl+C）或显式停止
-                while not self._stop_event.is_set():
-                    try:
-                        time.sleep(0.5)
-                    except KeyboardInterrupt:
-                        self._log("Received Ctrl+C, shutting down...")
-                        self._stop_event.set()
-                        break
+                # ws_url 来自注册响应, 在此拼好一次, 重连时直接复用
+                await self._ws_client_loop(self._ws_connect_url(ws_url))
             else:
-                # no ws support, continue with existing long-poll loop
-                try:
-                    self._task_loop()
-                except KeyboardInterrupt:
-                    self._log("Received Ctrl+C, shutting down...")
-                    self._stop_event.set()
-        finally:
-            # ensure heartbeat thread is stopped
-            self._stop_event.set()
-            heartbeat_thread.join(timeout=5)
-            if ws_thread and ws_thread.is_alive():
-                # give websocket thread a chance to exit gracefully
-                ws_thread.join(timeout=2)
+                await asyncio.gather(self._http_heartbeat_loop(), self._http_task_loop())
 
     # ------------------------------------------------------------------ network helpers
     def _request_headers(self) -> Dict[str, str]:
-        headers = {"Content-Type": "application/json"}
+        headers: Dict[str, str] = {}
         if self.token:
             headers["Authorization"] = f"Bearer {self.token}"
         return headers
 
-    def _post_json(self, path: str, payload: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
-        url = f"{self.server_url}{path}"
-        response = self.session.post(url, headers=self._request_headers(), json=payload, timeout=timeout)
+    async def _post_json(
+        self, path: str, payload: Dict[str, Any], timeout: int = 10, budget: float | None = None
+    ) -> Dict[str, Any]:
+        """POST JSON, retrying RETRY_STATUSES.
+
+        With ``budget``, all attempts and the waits between them finish within that many seconds.
+        """
+        url = self._endpoints.get(path) or f"{self.server_url}{path}"
+        # Content-Type 已在客户端默认头里, 直接发 orjson 编码后的 body
+        body = orjson.dumps(payload)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget if budget is not None else None
+        for attempt in range(HTTP_STATUS_RETRIES):
+            request_timeout: float = timeout
+            if deadline is not None:
+                request_timeout = min(timeout, max(deadline - loop.time(), 0.1))
+            response = await self._client.post(url, content=body, headers=self._auth_headers, timeout=request_timeout)
+            if response.status_code not in RETRY_STATUSES or attempt == HTTP_STATUS_RETRIES - 1:
+                break
+            delay = _retry_after(response, attempt)
+            # 剩余预算不够再等一轮时直接按本次响应报错, 不让重试拖过调用方的等待上限
+            if deadline is not None and loop.time() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
         response.raise_for_status()
         if not response.content:
             return {}
         return response.json()
 
-    def _get_json(self, path: str, params: Dict[str, Any], timeout: int) -> Optional[Dict[str, Any]]:
-        url = f"{self.server_url}{path}"
-        response = self.session.get(url, headers=self._request_headers(), params=params, timeout=timeout)
-        if response.status_code == 204:
-            return None
-        response.raise_for_status()
-        if not response.content:
-            return None
-        return response.json()
+    def _post_json_threadsafe(self, path: str, payload: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
+        """Blocking wrapper for worker threads: run _post_json on the agent's event loop."""
+        budget = timeout + 5
+        future = asyncio.run_coroutine_threadsafe(self._post_json(path, payload, timeout, budget=budget), self._loop)
+        try:
+            return future.result(budget + 1)
+        except TimeoutError:
+            # 调用方已按失败处理, 取消协程, 避免它在后台继续重试并在之后悄悄成功
+            future.cancel()
+            raise
 
     # ------------------------------------------------------------------ lifecycle
-    def _heartbeat_loop(self) -> None:
+    async def _http_heartbeat_loop(self) -> None:
+        """POST a heartbeat when status/task_id changes, otherwise at most every heartbeat_max_interval."""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self._hb_wakeup = (loop, wakeup)
+        wakeup.set()  # first beat goes out immediately
+        fail_streak = 0
+        last_state: Optional[tuple] = None
+        last_sent = 0.0
+        # client_id 在注册后不再变化, 只编码一次; 每次只拼接 status/task_id
+        body_prefix = b'{"client_id":' + orjson.dumps(self.client_id) + b',"status":'
         while not self._stop_event.is_set():
-            payload = {
-                "client_id": self.client_id,
-                "status": self._status,
-                "task_id": self._current_task_id,
-                "timestamp": datetime.utcnow().isoformat(),
-            }
             try:
-                self._post_json("/heartbeat", payload)
+                await asyncio.wait_for(wakeup.wait(), timeout=self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            state = (self._status, self._current_task_id)
+            if state == last_state and time.monotonic() - last_sent < self.heartbeat_max_interval:
+                continue
+            body = body_prefix + orjson.dumps(state[0]) + b',"task_id":' + orjson.dumps(state[1]) + b"}"
+            try:
+                response = await self._client.post(
+                    self._endpoints["/heartbeat"], content=body, headers=self._auth_headers, timeout=10
+                )
+                if response.status_code == 404:
+                    # 服务端已清理掉长时间失联的客户端, 重新注册后再继续心跳
+                    self._log("服务端未识别当前客户端，重新注册")
+                    await self._register()
+                    body_prefix = b'{"client_id":' + orjson.dumps(self.client_id) + b',"status":'
+                    wakeup.set()
+                    continue
+                response.raise_for_status()
             except Exception as exc:  # noqa: BLE001
                 self._log(f"Heartbeat failed: {exc}")
-            finally:
-                self._stop_event.wait(self.heartbeat_interval)
+                await asyncio.sleep(_backoff_delay(self.heartbeat_interval, fail_streak))
+                fail_streak += 1
+                wakeup.set()
+                continue
+            fail_streak = 0
+            last_state, last_sent = state, time.monotonic()
 
-    def _task_loop(self) -> None:
+    async def _http_task_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        fail_streak = 0
         while not self._stop_event.is_set():
             payload: Optional[Dict[str, Any]] = None
             try:
-                payload = self._get_json(
-                    "/task",
-                    {"client_id": self.client_id},
-                    timeout=self.long_poll_timeout,
+                response = await self._client.get(
+                    self._endpoints["/task"],
+                    params={"client_id": self.client_id},
+                    headers=self._auth_headers,
+                    # 连接阶段仍按 5 秒失败, 只有读取阶段等待完整的长轮询时长
+                    timeout=httpx.Timeout(float(self.long_poll_timeout), connect=5.0),
                 )
-            except requests.RequestException as exc:
+                if response.status_code != 204:
+                    response.raise_for_status()
+                    if response.content:
+                        payload = response.json()
+            except (httpx.HTTPError, ValueError) as exc:
                 self._log(f"Task polling error: {exc}")
-                self._stop_event.wait(self.poll_interval)
+                # 服务端不稳定时指数退避, 避免反复重连
+                await asyncio.sleep(_backoff_delay(self.poll_interval, fail_streak))
+                fail_streak += 1
                 continue
+            fail_streak = 0
 
             if not payload:
                 continue
@@ -190,33 +476,44 @@ class TaskAgent:
                 self._log("Server returned malformed task payload")
                 continue
 
-            self._handle_task(task_data)
+            # Playwright's sync API must stay off the event loop thread.
+            await loop.run_in_executor(EXECUTOR, self._handle_task, task_data)
 
     # ------------------------------------------------------------------ task processing
     def _handle_task(self, task_payload: Dict[str, Any]) -> None:
         task_id = str(task_payload.get("task_id") or uuid.uuid4().hex)
-        run_dir = RUNTIME_ROOT / task_id
-        run_dir.mkdir(parents=True, exist_ok=True)
+        run_dir = os.path.join(self._runtime_root, task_id)
+        os.makedirs(run_dir, exist_ok=True)
 
         self._set_status("running", task_id)
-        log_lines: list[str] = []
+        # 只保留最近的日志行随结果上报; WS 在线时逐行实时推送给服务端
+        log_lines: deque[str] = deque(maxlen=TASK_LOG_LIMIT)
 
         def _task_log(message: str) -> None:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            timestamp = _timestamp()
             log_line = f"[{timestamp}] {message}"
             log_lines.append(log_line)
+            self._stream_log(task_id, log_line)
 
         task_headless = _coerce_bool(task_payload.get("headless"), self.headless)
 
-        def _invoke_uploader() -> Dict[str, Any]:
-            uploader = TaskUploader(headless=task_headless)
-            return uploader.upload(task, log=_task_log)
+        uploader = TaskUploader(headless=task_headless)
         result_status = "success"
         result_reason = "任务完成"
         artifacts: Dict[str, Any] = {}
 
         try:
-            task_zip = self._prepare_task_archive(task_payload, run_dir)
+            # 任务包的下载/解码交给辅助线程, 本线程同时预热浏览器
+            # (Playwright 同步 API 只能在创建它的线程中使用)
+            archive_future = ARCHIVE_EXECUTOR.submit(self._prepare_task_archive, task_payload, run_dir)
+            try:
+                uploader.warm_up()
+            except Exception as exc:  # noqa: BLE001
+                _task_log(f"浏览器预热失败，将在上传时重试：{exc}")
+            task_zip = archive_future.result()
+            # 压缩包已落盘, 尽早释放内联的 ZIP 数据, 避免排队任务长期占用内存
+            task_payload.pop("zip_bytes", None)
+            task_payload.pop("zip_base64", None)
             loader = TaskLoader(run_dir)
             tasks = loader.load_tasks()
             if not tasks:
@@ -229,19 +526,10 @@ class TaskAgent:
             if not task.is_config_complete():
                 raise RuntimeError("任务配置不完整，缺少著作权人信息或登录参数")
 
-            _task_log(f"开始执行任务：{task.display_name()}，zip={task_zip.name}")
-            # If this code is running inside an asyncio event loop (e.g. the WebSocket client thread),
-            # calling Playwright's sync API directly will raise an error. Detect a running loop and
-            # dispatch the synchronous uploader to a separate thread pool to avoid invoking sync
-            # Playwright APIs on the event loop thread.
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                # No running event loop in current thread — safe to call directly.
-                artifacts = _invoke_uploader()
-            else:
-                # Running inside an asyncio loop — run uploader in dedicated threadpool.
-                artifacts = UPLOADER_EXECUTOR.submit(_invoke_uploader).result()
+            _task_log(f"开始执行任务：{task.display_name()}，zip={os.path.basename(task_zip)}")
+            # _handle_task always runs on an EXECUTOR worker thread, never on the event loop,
+            # so Playwright's sync API can be called directly here.
+            artifacts = uploader.upload(task, log=_task_log)
             result_reason = "上传成功"
             self._log(f"[{task_id}] 执行成功")
         except Exception as exc:  # noqa: BLE001
@@ -249,36 +537,61 @@ class TaskAgent:
             result_reason = f"{exc}"
             self._log(f"[{task_id}] 执行失败：{exc}")
         finally:
+            # 每个任务都有自己的 TaskUploader; 预热后上传未执行(下载/解析失败)时
+            # 也要关掉浏览器和 Playwright 驱动, 且必须在创建它的本线程里关闭
+            uploader.close()
             cleanup = task_payload.get("cleanup", True)
             if cleanup:
-                shutil.rmtree(run_dir, ignore_errors=True)
+                _schedule_cleanup(run_dir)
 
         self._submit_result(
             task_id=task_id,
             status=result_status,
             reason=result_reason,
-            logs=log_lines,
+            logs=list(log_lines),
             artifacts=artifacts,
         )
         self._set_status("idle", None)
 
-    def _prepare_task_archive(self, payload: Dict[str, Any], run_dir: Path) -> Path:
+    def _prepare_task_archive(self, payload: Dict[str, Any], run_dir: str) -> str:
         """Download or decode the task ZIP into run_dir and return its path."""
-        zip_path = run_dir / (payload.get("zip_filename") or f"{uuid.uuid4().hex}.zip")
+        zip_path = os.path.join(run_dir, payload.get("zip_filename") or f"{uuid.uuid4().hex}.zip")
+        if payload.get("zip_bytes"):
+            with open(zip_path, "wb") as fp:
+                fp.write(payload["zip_bytes"])
+            return zip_path
+        # legacy inline payload from servers that do not send binary frames
         if payload.get("zip_base64"):
-            data = base64.b64decode(payload["zip_base64"])
-            zip_path.write_bytes(data)
+            # decode in 4-aligned slices so the full binary never sits in memory next to the base64 text
+            encoded = payload["zip_base64"]
+            # 解码前先按长度估算大小, 超限的任务包直接拒绝, 不再分配解码缓冲
+            if len(encoded) // 4 * 3 > MAX_ARCHIVE_BYTES:
+                raise RuntimeError(f"任务包过大：超过上限 {MAX_ARCHIVE_BYTES} 字节")
+            with open(zip_path, "wb") as fp:
+                for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                    fp.write(base64.b64decode(encoded[start : start + BASE64_CHUNK_SIZE]))
             return zip_path
 
         zip_url = payload.get("zip_url")
         if not zip_url:
             raise RuntimeError("任务缺少 zip_url 或 zip_base64 字段")
 
-        resp = self.session.get(zip_url, timeout=60, stream=True)
-        resp.raise_for_status()
-        with zip_path.open("wb") as fp:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
+        headers = {"Accept-Encoding": "identity"}
+        # 服务端自己的 /tasks/{task_id}/archive 需要鉴权; 其他来源的地址不带令牌
+        if _url_origin(zip_url) == self._server_origin:
+            headers.update(self._auth_headers)
+        with self.session.stream("GET", zip_url, headers=headers, timeout=DOWNLOAD_TIMEOUT) as resp:
+            resp.raise_for_status()
+            declared = int(resp.headers.get("Content-Length") or 0)
+            if declared > MAX_ARCHIVE_BYTES:
+                raise RuntimeError(f"任务包过大：{declared} 字节，超过上限 {MAX_ARCHIVE_BYTES}")
+            received = 0
+            with open(zip_path, "wb") as fp:
+                # identity 编码下原始字节即文件内容, 跳过解码层直接落盘
+                for chunk in resp.iter_raw(DOWNLOAD_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > MAX_ARCHIVE_BYTES:
+                        raise RuntimeError(f"任务包过大：超过上限 {MAX_ARCHIVE_BYTES} 字节")
                     fp.write(chunk)
         return zip_path
 
@@ -307,23 +620,17 @@ class TaskAgent:
             "artifacts": files_payload,
         }
         try:
-            self._post_json("/task_result", payload, timeout=20)
+            self._post_json_threadsafe("/task_result", payload, timeout=20)
         except Exception as exc:  # noqa: BLE001
             self._log(f"上报任务结果失败：{exc}")
 
     # ------------------------------------------------------------------ registration & state
-    def _register(self) -> None:
-        payload = {
-            "client_id": self.client_id,
-            "hostname": platform.node(),
-            "platform": platform.platform(),
-            "python_version": platform.python_version(),
-            "headless": self.headless,
-        }
+    async def _register(self) -> Dict[str, Any]:
+        payload = {"client_id": self.client_id, **self._host_info, "headless": self.headless}
         try:
-            data = self._post_json("/register", payload)
+            data = await self._post_json("/register", payload)
             assigned_id = data.get("client_id")
-            if assigned_id:
+            if assigned_id and str(assigned_id) != self.client_id:
                 self.client_id = str(assigned_id)
                 self._save_client_id()
             self._log(f"注册成功，client_id={self.client_id}")
@@ -334,152 +641,243 @@ class TaskAgent:
     def _load_client_id(self) -> str:
         if STATE_FILE.exists():
             try:
-                data = json.loads(STATE_FILE.read_text(encoding="utf-8"))
+                data = orjson.loads(STATE_FILE.read_bytes())
                 if data.get("client_id"):
-                    return str(data["client_id"])
-            except json.JSONDecodeError:
+                    self._persisted_client_id = str(data["client_id"])
+                    return self._persisted_client_id
+            except orjson.JSONDecodeError:
                 pass
         client_id = uuid.uuid4().hex
         self._save_client_id(client_id)
         return client_id
 
     def _save_client_id(self, client_id: Optional[str] = None) -> None:
-        STATE_FILE.write_text(json.dumps({"client_id": client_id or self.client_id}, ensure_ascii=False), encoding="utf-8")
+        client_id = client_id or self.client_id
+        if client_id == self._persisted_client_id:
+            return
+        # 先写临时文件再替换, 避免中途退出留下半截的状态文件
+        tmp_path = STATE_FILE.with_suffix(".tmp")
+        tmp_path.write_bytes(orjson.dumps({"client_id": client_id}))
+        os.replace(tmp_path, STATE_FILE)
+        self._persisted_client_id = client_id
 
     def _set_status(self, status: str, task_id: Optional[str]) -> None:
         with self._status_lock:
             self._status = status
             self._current_task_id = task_id
+        # 状态变化时立即唤醒 HTTP 心跳，而不是等到下一个周期
+        if self._hb_wakeup is not None:
+            loop, wakeup = self._hb_wakeup
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(wakeup.set)
 
     # ------------------------------------------------------------------ logging
     def _log(self, message: str) -> None:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = _timestamp()
         print(f"[agent {timestamp}] {message}")
 
     # ------------------------------------------------------------------ websocket client
-    def _ws_thread_entry(self, ws_url: str) -> None:
-        """Thread entrypoint to run asyncio websocket client loop."""
-        try:
-            asyncio.run(self._ws_client_loop(ws_url))
-        except Exception as exc:  # noqa: BLE001
-            self._log(f"WebSocket thread exiting with error: {exc}")
-
-    async def _ws_client_loop(self, ws_url: str) -> None:
+    def _ws_connect_url(self, ws_url: str) -> str:
+        """Append the token as a query parameter; extra_headers is rejected by some websockets/loop combos."""
+        if not self.token:
+            return ws_url
+        parts = urlparse(ws_url)
+        qs = dict(parse_qsl(parts.query))
+        qs.setdefault("token", self.token)
+        return urlunparse(parts._replace(query=urlencode(qs)))
+
+    async def _ws_client_loop(self, ws_connect_url: str) -> None:
         backoff = 1
         max_backoff = 60
-        # We'll avoid passing extra_headers to websockets.connect (some event loops reject it).
-        # Instead, append token as a query parameter if provided and let server accept it.
-        headers = {}
-        ws_connect_url = ws_url
-        if self.token:
-            # append token as query param
-            from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
-
-            parts = urlparse(ws_url)
-            qs = dict(parse_qsl(parts.query))
-            qs.setdefault("token", self.token)
-            new_query = urlencode(qs)
-            parts = parts._replace(query=new_query)
-            ws_connect_url = urlunparse(parts)
-
         while not self._stop_event.is_set():
             try:
-                # allow larger messages (e.g. task payloads containing base64 zips)
-                async with websockets.connect(ws_connect_url, ping_interval=None, max_size=10_000_000) as ws:
+                # allow larger messages (inline ZIP frames); ZIPs and small JSON frames gain nothing from
+                # per-message deflate, and protocol pings detect dead links without app-level traffic
+                async with websockets.connect(
+                    ws_connect_url,
+                    ping_interval=20,
+                    ping_timeout=20,
+                    compression=None,
+                    max_size=WS_MAX_MESSAGE_BYTES,
+                    write_limit=2**20,
+                ) as ws:
                     self._log("WebSocket connected")
+                    self._open_ws_session(ws)
                     backoff = 1
 
                     # send register packet
                     register_pkt = {"type": "register", "payload": {
                         "client_id": self.client_id,
-                        "hostname": os.uname().nodename if hasattr(os, "uname") else platform.node(),
-                        "platform": platform.platform(),
-                        "python_version": platform.python_version(),
+                        **self._host_info,
                         "headless": self.headless,
                     }}
-                    await ws.send(json.dumps(register_pkt))
+                    self._ws_enqueue(_ws_frame(register_pkt))
 
-                    # start heartbeat task
-                    hb_task = asyncio.create_task(self._ws_heartbeat_task(ws))
+                    # heartbeat 由 loop 定时回调驱动, 不再常驻一个 sleep 协程
+                    self._hb_static = b'{"type":"heartbeat","payload":{"client_id":' + orjson.dumps(self.client_id)
+                    self._send_ws_heartbeat()
 
                     # listen for messages
+                    # a task flagged with zip_binary is followed by one binary frame holding the ZIP
+                    self._awaiting_archive.clear()
+                    handlers = self._ws_handlers
                     async for raw in ws:
+                        if isinstance(raw, (bytes, bytearray)):
+                            self._on_ws_archive(raw)
+                            continue
                         try:
-                            msg = json.loads(raw)
+                            msg = orjson.loads(raw)
                         except Exception:
                             continue
                         if not isinstance(msg, dict):
                             continue
                         msg_type = msg.get("type")
-                        payload = msg.get("payload") or {}
-
-                        if msg_type == "task":
-                            # accept task and run in executor to avoid blocking loop
-                            task_payload = payload
-                            task_id = str(task_payload.get("task_id") or uuid.uuid4().hex)
-                            # log receipt of the task for debugging
-                            try:
-                                self._log(f"ws: received task_id={task_id}")
-                            except Exception:
-                                pass
-                            # send task_ack accepted
-                            ack = {"type": "task_ack", "payload": {"task_id": task_id, "accepted": True}}
-                            try:
-                                await ws.send(json.dumps(ack))
-                            except Exception:
-                                pass
-
-                            # schedule handling
-                            try:
-                                self._log(f"ws: scheduling task_id={task_id} to executor")
-                                EXECUTOR.submit(self._handle_task, task_payload)
-                            except Exception as exc:  # noqa: BLE001
-                                self._log(f"ws: failed to schedule task_id={task_id}: {exc}")
-                        elif msg_type == "heartbeat":
-                            # server heartbeat request; respond with ack
-                            try:
-                                await ws.send(json.dumps({"type": "heartbeat_ack", "payload": {}}))
-                            except Exception:
-                                pass
-                        elif msg_type == "heartbeat_ack":
-                            # heartbeat acknowledgement from server — handle quietly to avoid noisy logs
-                            # could update internal timestamp or metrics here if desired
-                            continue
-                        elif msg_type == "result":
-                            # server pushed a result for some reason — record it via HTTP
-                            try:
-                                payload["client_id"] = self.client_id
-                                # delegate to same recorder used by HTTP endpoint via executor
-                                loop = asyncio.get_running_loop()
-                                asyncio.create_task(loop.run_in_executor(None, self._post_json, "/task_result", payload, 20))
-                            except Exception:
-                                pass
-                        elif msg_type == "register_ack":
-                            # ignore or log
-                            self._log("ws: register acknowledged")
-                        else:
+                        handler = handlers.get(msg_type)
+                        if handler is None:
                             # unknown message
                             self._log(f"ws: unknown message type: {msg_type}")
-
-                    hb_task.cancel()
+                            continue
+                        handler(msg.get("payload") or {})
+                self._close_ws_session()
             except Exception as exc:  # noqa: BLE001
+                self._close_ws_session()
                 self._log(f"WebSocket connection error: {exc}")
                 if self._stop_event.is_set():
                     break
                 await asyncio.sleep(backoff)
                 backoff = min(max_backoff, backoff * 2)
 
-    async def _ws_heartbeat_task(self, ws: websockets.WebSocketClientProtocol) -> None:
+    # ------------------------------------------------------------------ websocket message handlers
+    def _on_ws_task(self, payload: Dict[str, Any]) -> None:
+        if payload.get("zip_binary"):
+            self._awaiting_archive.append(payload)
+            return
+        self._accept_ws_task(payload)
+
+    def _on_ws_task_batch(self, payload: Dict[str, Any]) -> None:
+        # 批量下发: 每个任务与单条 task 消息处理一致, ZIP 二进制帧按任务顺序紧随其后
+        for task_payload in payload.get("tasks") or []:
+            self._on_ws_task(task_payload)
+
+    def _on_ws_archive(self, raw: bytes) -> None:
+        if not self._awaiting_archive:
+            self._log("ws: unexpected binary frame, ignored")
+            return
+        task_payload = self._awaiting_archive.popleft()
+        task_payload["zip_bytes"] = bytes(raw)
+        self._accept_ws_task(task_payload)
+
+    def _on_ws_heartbeat(self, payload: Dict[str, Any]) -> None:
+        # server heartbeat request; respond with ack
+        self._ws_enqueue(_ws_frame({"type": "heartbeat_ack", "payload": {}}))
+
+    def _on_ws_heartbeat_ack(self, payload: Dict[str, Any]) -> None:
+        # heartbeat acknowledgement from server — handle quietly to avoid noisy logs
+        pass
+
+    def _on_ws_result(self, payload: Dict[str, Any]) -> None:
+        # server pushed a result for some reason — record it via HTTP
+        payload["client_id"] = self.client_id
+        task = asyncio.create_task(self._post_json("/task_result", payload, 20))
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._on_bg_task_done)
+
+    def _on_bg_task_done(self, task: asyncio.Task) -> None:
+        self._bg_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._log(f"ws: background request failed: {task.exception()}")
+
+    def _on_ws_register_ack(self, payload: Dict[str, Any]) -> None:
+        self._log("ws: register acknowledged")
+
+    def _open_ws_session(self, ws: websockets.WebSocketClientProtocol) -> None:
+        """Attach the outbound queue and its sender task to a freshly connected socket."""
+        self._ws_out = asyncio.Queue()
+        self._ws_loop = asyncio.get_running_loop()
+        self._ws_sender = asyncio.create_task(self._ws_send_loop(ws, self._ws_out))
+        self._ws = ws
+
+    def _close_ws_session(self) -> None:
+        self._ws = None
+        self._ws_out = None
+        if self._hb_timer is not None:
+            self._hb_timer.cancel()
+            self._hb_timer = None
+        if self._ws_sender is not None:
+            self._ws_sender.cancel()
+            self._ws_sender = None
+
+    async def _ws_send_loop(self, ws: websockets.WebSocketClientProtocol, out: "asyncio.Queue[str]") -> None:
+        """Single writer for the socket: drain everything queued in the same tick and send it back-to-back.
+
+        The frames land in the transport buffer together, so a burst of acks/logs/heartbeats is flushed
+        with far fewer writes than one awaited send per message. Each message stays its own text frame
+        because the server parses exactly one JSON object per frame.
+        """
+        while True:
+            batch = [await out.get()]
+            while not out.empty():
+                batch.append(out.get_nowait())
+            try:
+                for frame in batch:
+                    await ws.send(frame)
+            except Exception:  # noqa: BLE001
+                # connection closed; the receive loop notices and reconnects
+                return
+
+    def _ws_enqueue(self, frame: str) -> None:
+        """Queue an outbound frame; must be called on the event loop thread."""
+        if self._ws_out is not None:
+            self._ws_out.put_nowait(frame)
+
+    def _accept_ws_task(self, task_payload: Dict[str, Any]) -> None:
+        """Queue a task received over WebSocket in the executor and ack it.
+
+        The task is rejected with reason "busy" when the executor queue is full.
+        """
+        task_id = str(task_payload.get("task_id") or uuid.uuid4().hex)
+        # log receipt of the task for debugging
+        try:
+            self._log(f"ws: received task_id={task_id}")
+        except Exception:
+            pass
+        # schedule handling first so the ack reflects whether the task was actually queued
+        ack_payload: Dict[str, Any] = {"task_id": task_id, "accepted": True}
         try:
-            while not self._stop_event.is_set():
-                payload = {"client_id": self.client_id, "status": self._status, "task_id": self._current_task_id}
-                try:
-                    await ws.send(json.dumps({"type": "heartbeat", "payload": payload}))
-                except Exception:
-                    return
-                await asyncio.sleep(self.heartbeat_interval)
-        except asyncio.CancelledError:
+            self._log(f"ws: scheduling task_id={task_id} to executor")
+            EXECUTOR.submit(self._handle_task, task_payload)
+        except queue.Full:
+            self._log(f"ws: executor queue full, rejecting task_id={task_id}")
+            ack_payload.update(accepted=False, reason="busy")
+        except Exception as exc:  # noqa: BLE001
+            self._log(f"ws: failed to schedule task_id={task_id}: {exc}")
+            ack_payload.update(accepted=False, reason=str(exc))
+        self._ws_enqueue(_ws_frame({"type": "task_ack", "payload": ack_payload}))
+
+    def _stream_log(self, task_id: str, line: str) -> None:
+        """Forward one task log line over the open WebSocket; called from worker threads, never blocks."""
+        if self._ws is None or self._ws_loop is None:
             return
+        frame = _ws_frame({"type": "log", "payload": {"task_id": task_id, "message": line}})
+        with contextlib.suppress(RuntimeError):
+            self._ws_loop.call_soon_threadsafe(self._ws_enqueue, frame)
+
+    def _send_ws_heartbeat(self) -> None:
+        """Timer callback: queue one heartbeat and re-arm the timer."""
+        self._hb_timer = None
+        if self._stop_event.is_set() or self._ws_out is None:
+            return
+        # 静态部分 (client_id) 连接时已序列化, 这里只拼接会变化的 status/task_id
+        frame = (
+            self._hb_static
+            + b',"status":'
+            + orjson.dumps(self._status)
+            + b',"task_id":'
+            + orjson.dumps(self._current_task_id)
+            + b"}}"
+        )
+        self._ws_enqueue(frame.decode("utf-8"))
+        self._hb_timer = asyncio.get_running_loop().call_later(self.heartbeat_interval, self._send_ws_heartbeat)
 
 
 def parse_args() -> argparse.Namespace:
@@ -3,22 +3,44 @@ from __future__ import annotations
 
 import asyncio
 import base64
-import json
+import dataclasses
+import functools
+import hmac
+import io
+import logging
+import logging.handlers
 import os
+import queue
 import shutil
 import sys
+import tempfile
+import threading
 import time
 import uuid
-from collections import deque
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Set, Tuple
 
-from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, JSONResponse, Response
+import anyio
+import anyio.to_thread
+import orjson
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from pydantic import BaseModel, Field, ValidationError
 from starlette.concurrency import run_in_threadpool
 
+# 热路径只把日志记录放进队列，由后台线程统一写 stderr，避免 print 抢 stdout 锁阻塞事件循环
+_LOG_QUEUE: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_LOG_LISTENER = logging.handlers.QueueListener(_LOG_QUEUE, logging.StreamHandler())
+logger = logging.getLogger("rzapply.api")
+logger.addHandler(logging.handlers.QueueHandler(_LOG_QUEUE))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
 # Ensure the existing rzapply modules are importable when running from api_server.
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
@@ -26,15 +48,44 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from models import Task  # noqa: E402
 from task_loader import TaskLoader  # noqa: E402
-from uploader import TaskUploader, ensure_storage_state_file  # noqa: E402
+from uploader import AUTH_DIR, TaskUploader, ensure_storage_state_file  # noqa: E402
 
 RUNTIME_DIR = Path(os.environ.get("RZAPPLY_API_RUNTIME", PROJECT_ROOT / "api_runtime"))
 RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
 
+# 入队任务的 ZIP 暂存在磁盘上，派发时再读取，避免排队期间整包常驻内存
+ARCHIVE_DIR = RUNTIME_DIR / "queued_archives"
+ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+THREAD_TOKENS = int(os.environ.get("RZAPPLY_THREAD_TOKENS", "100"))
+# 上传/复制时每次读写的块大小，可通过 RZAPPLY_UPLOAD_CHUNK 调整（字节）
+UPLOAD_CHUNK_SIZE = max(int(os.environ.get("RZAPPLY_UPLOAD_CHUNK", str(1 << 20))), 64 * 1024)
+# 单个任务 ZIP 的大小上限，超出直接返回 413，不落盘也不解码
+MAX_ZIP_BYTES = int(os.environ.get("RZAPPLY_MAX_ZIP_BYTES", str(512 << 20)))
+# WebSocket 内联下发的 ZIP 上限，须不超过 agent 端 websockets 的 max_size（10_000_000），
+# 更大的任务包改发 /tasks/{task_id}/archive 下载地址，否则 agent 以 1009 断开后任务会被反复重派
+WS_INLINE_ZIP_LIMIT = int(os.environ.get("RZAPPLY_WS_INLINE_ZIP_BYTES", "10000000"))
+# /tasks/upload 单次响应最多保留的日志行数，超出时丢弃最早的行
+LOG_LIMIT = max(int(os.environ.get("RZAPPLY_LOG_LIMIT", "10000")), 1)
+# config_json 只是少量覆盖字段，超过此长度直接拒绝，不做解析
+CONFIG_JSON_MAX_CHARS = 256 * 1024
+# base64 入队的任务包按此字符数分片解码（必须是 4 的倍数）
+BASE64_CHUNK_SIZE = 4 << 18
+
 ARTIFACTS_ROOT = Path(os.environ.get("RZAPPLY_API_OUTPUT", PROJECT_ROOT / "tasks_output"))
 ARTIFACTS_ROOT.mkdir(parents=True, exist_ok=True)
+# 导入时解析一次，之后拼出的产物路径都是绝对路径，按字符串前缀截取即可
+ARTIFACTS_ROOT = ARTIFACTS_ROOT.resolve()
+_PROJECT_PREFIX = str(PROJECT_ROOT) + os.sep
+_ENSURED_BUCKETS: Set[str] = set()
+_ENSURED_LOCK = threading.Lock()
+# /files/sign-page 的路径解析结果：bucket -> {filename: (过期时间, 路径)}
+_SIGN_PDF_CACHE: Dict[str, Dict[str | None, Tuple[float, Path]]] = {}
+SIGN_PDF_CACHE_TTL = 30
+SIGN_PDF_CACHE_LIMIT = 1024
 
-app = FastAPI(title="rzapply API", version="0.1.0")
+app = FastAPI(title="rzapply API", version="0.1.0", default_response_class=ORJSONResponse)
+# 签章页 PDF 与较大的 JSON 响应按需压缩；agent 下载任务包时会声明 identity，不受影响
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
 def _env_flag(name: str, default: bool = False) -> bool:
@@ -45,68 +96,226 @@ def _env_flag(name: str, default: bool = False) -> bool:
 
 
 DEFAULT_HEADLESS = _env_flag("RZAPPLY_HEADLESS", True)
+# /tasks/upload 复用的常驻浏览器数量，同时也是该接口的最大并发上传数
+UPLOADER_POOL_SIZE = max(int(os.environ.get("RZAPPLY_UPLOADER_POOL", "4")), 1)
 
 AGENT_TOKEN = (os.environ.get("RZAPPLY_AGENT_TOKEN") or "").strip()
+# last_seen / started_at 记录 time.monotonic()，只在 /debug/agents 展示时换算成墙钟时间
+# 轮询 agent 超过 max(AGENT_STALE_SECONDS, 3 × 其上报的心跳间隔) 未心跳会被清理；
+# 默认值按 agent 默认心跳 30s、空闲时最长 60s 一次的 3 倍取值，兼容不上报间隔的旧版 agent
+AGENT_STALE_SECONDS = float(os.environ.get("RZAPPLY_AGENT_STALE_SECONDS", "180"))
+AGENT_STALE_FACTOR = 3
+AGENT_REAP_INTERVAL = 30
+# 被清理的 agent 手上的任务 -> 原 client_id；该 agent 之后迟到的结果直接忽略，避免重复记录
+AGENT_REAPED_TASKS: "OrderedDict[str, str]" = OrderedDict()
+AGENT_REAPED_TASKS_LIMIT = 1024
+_EXPECTED_AUTH = f"Bearer {AGENT_TOKEN}".encode() if AGENT_TOKEN else None
+_EXPECTED_TOKEN = AGENT_TOKEN.encode() if AGENT_TOKEN else None
 AGENT_PENDING_TASKS = deque()
 AGENT_RUNNING_TASKS: Dict[str, Dict[str, Any]] = {}
-AGENT_CLIENTS: Dict[str, Dict[str, Any]] = {}
-AGENT_RESULTS: Dict[str, Dict[str, Any]] = {}
+AGENT_CLIENTS: Dict[str, AgentClient] = {}
+# 只保留最近的结果，避免长期运行时无限增长
+# 结果写入时就编码成 JSON bytes，读取时原样返回，不再重复序列化
+AGENT_RESULTS: "OrderedDict[str, bytes]" = OrderedDict()
+AGENT_RESULTS_LIMIT = 1024
+AGENT_RESULT_LOG_LINES = 500
+# 锁按数据分片：AGENT_LOCK 管任务状态（待派发队列、运行中任务），AGENT_WS_LOCK 管 WS 连接/空闲集合，
+# AGENT_CLIENTS_LOCK 只管客户端信息，AGENT_RESULTS_LOCK 只管结果；需要多个时按此顺序获取，
+# 只有 _dispatch_tasks 会同时持有 AGENT_LOCK 与 AGENT_WS_LOCK，其余路径依次获取、不嵌套
 AGENT_LOCK = asyncio.Lock()
-AGENT_WS_CONNECTIONS: Dict[str, WebSocket] = {}
-AGENT_WS_IDLE: Set[str] = set()
+AGENT_WS_LOCK = asyncio.Lock()
+AGENT_CLIENTS_LOCK = asyncio.Lock()
+AGENT_RESULTS_LOCK = asyncio.Lock()
+# 与 AGENT_LOCK 绑定：入队/回队时 notify，HTTP 长轮询在此等待而不是每秒轮询
+AGENT_TASKS_READY = asyncio.Condition(AGENT_LOCK)
+AGENT_WS_CONNECTIONS: Dict[str, AgentConnection] = {}
+# 每个 WS 连接的待发送帧上限；写满说明 agent 读得太慢，直接断开而不是拖住派发
+WS_SEND_QUEUE_SIZE = 32
+# 空闲的 WebSocket agent，按变为空闲的先后顺序排队，派发时先进先出
+AGENT_WS_IDLE: "OrderedDict[str, None]" = OrderedDict()
+# 同一轮事件循环内的多次入队只触发一次派发
+_DISPATCH_SCHEDULED = False
+_DISPATCH_RUNS: Set[asyncio.Task] = set()
+
+
+# 复制回退路径用的缓冲区按线程复用（线程池里并发复制互不干扰），避免每次分配 1 MiB
+_COPY_BUFFERS = threading.local()
+
+
+def _copy_buffer() -> memoryview:
+    buf = getattr(_COPY_BUFFERS, "buf", None)
+    if buf is None:
+        buf = _COPY_BUFFERS.buf = memoryview(bytearray(UPLOAD_CHUNK_SIZE))
+    return buf
+
+
+def _fast_copy(src: Any, dst: Any) -> None:
+    """Copy an open binary file into ``dst``: os.sendfile when both ends expose a descriptor, else a reused buffer."""
+    # 只看公开的 fileno()：BytesIO 等内存文件会抛 UnsupportedOperation, 直接走缓冲区复制；
+    # 仍在内存里的 SpooledTemporaryFile 会因此落盘, 但它最多只有 spool 上限大小
+    if hasattr(os, "sendfile"):
+        try:
+            src_fd, dst_fd = src.fileno(), dst.fileno()
+            offset = src.tell()
+            remaining = os.fstat(src_fd).st_size - offset
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+        else:
+            dst.flush()
+            try:
+                while remaining > 0:
+                    sent = os.sendfile(dst_fd, src_fd, offset, remaining)
+                    if sent == 0:
+                        break
+                    offset += sent
+                    remaining -= sent
+                src.seek(offset)
+                dst.seek(0, os.SEEK_END)
+                if remaining <= 0:
+                    return
+            except OSError:
+                # 部分平台/文件系统不支持 sendfile, 从当前偏移继续用缓冲区复制
+                src.seek(offset)
+                dst.seek(0, os.SEEK_END)
+    buf = _copy_buffer()
+    readinto = getattr(src, "readinto", None)
+    if readinto is None:
+        shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+        return
+    while n := readinto(buf):
+        dst.write(buf[:n])
 
 
-def _persist_upload(file: UploadFile, target_dir: Path) -> Path:
-    target_dir.mkdir(parents=True, exist_ok=True)
-    filename = Path(file.filename or "upload.zip").name
+def _check_upload_size(file: UploadFile) -> None:
+    size = file.size
+    if size is None:
+        # 旧版 Starlette 不提供 size，直接看已缓存的上传文件长度
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+    if size > MAX_ZIP_BYTES:
+        raise HTTPException(status_code=413, detail=f"ZIP 文件过大：超过上限 {MAX_ZIP_BYTES} 字节")
+
+
+def _persist_upload(file: UploadFile, target_dir: Path, filename: str | None = None) -> Path:
+    """Copy the upload to disk chunk by chunk; blocking, call via run_in_threadpool."""
+    filename = filename or Path(file.filename or "upload.zip").name
     save_path = target_dir / filename
-    with save_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        buffer = open(save_path, "wb", buffering=UPLOAD_CHUNK_SIZE)
+    except FileNotFoundError:
+        # 目录通常已存在，只有首次写入时才补建
+        target_dir.mkdir(parents=True, exist_ok=True)
+        buffer = open(save_path, "wb", buffering=UPLOAD_CHUNK_SIZE)
+    with buffer:
+        _fast_copy(file.file, buffer)
     return save_path
 
 
+def _write_archive(encoded: str) -> Path:
+    """Decode a base64 ZIP straight into the archive dir, slice by slice, without the full decoded copy."""
+    if any(ch in encoded for ch in "\r\n \t"):
+        encoded = "".join(encoded.split())
+    save_path = ARCHIVE_DIR / f"{uuid.uuid4().hex}.zip"
+    try:
+        with save_path.open("wb") as fp:
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                fp.write(base64.b64decode(encoded[start : start + BASE64_CHUNK_SIZE]))
+    except ValueError:
+        save_path.unlink(missing_ok=True)
+        raise
+    return save_path
+
+
+def _discard_archive(task: Dict[str, Any]) -> None:
+    zip_path = task.get("zip_path")
+    if zip_path:
+        Path(zip_path).unlink(missing_ok=True)
+
+
+def _parse_config_json(config_json: str) -> Dict[str, Any]:
+    if len(config_json) > CONFIG_JSON_MAX_CHARS:
+        raise HTTPException(status_code=413, detail=f"config_json 过大：超过上限 {CONFIG_JSON_MAX_CHARS} 字符")
+    try:
+        extra = orjson.loads(config_json)
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail=f"config_json 不是合法 JSON：{exc}") from exc
+    if not isinstance(extra, dict):
+        raise HTTPException(status_code=400, detail="config_json 必须是 JSON 对象")
+    return extra
+
+
 def _apply_config_overrides(task: Task, overrides: Dict[str, Any]) -> None:
-    cleaned = {k: v for k, v in overrides.items() if isinstance(v, str) and v.strip()}
-    cleaned.update({k: v for k, v in overrides.items() if not isinstance(v, str)})
+    # 一次遍历：丢弃空白字符串，其余值（含非字符串）原样保留
+    cleaned = {k: v for k, v in overrides.items() if not isinstance(v, str) or v.strip()}
     if cleaned:
         task.update_config(cleaned)
 
 
 def _relative_to_project(path: Path) -> str:
-    try:
-        return str(path.resolve().relative_to(PROJECT_ROOT))
-    except ValueError:
-        return str(path.resolve())
+    # PROJECT_ROOT、ARTIFACTS_ROOT 都已在导入时 resolve，这里不再逐段 lstat；
+    # 但路径里拼了 task_id/run_id，先 normpath 折叠 ".." 和重复分隔符再比前缀，避免返回越出项目目录的相对路径
+    text = os.path.normpath(os.fspath(path))
+    return text.removeprefix(_PROJECT_PREFIX) if text.startswith(_PROJECT_PREFIX) else text
+
+
+def _ensure_bucket_dir(bucket: str, target_root: Path) -> None:
+    # 每个 bucket 目录在进程内只创建一次
+    if bucket in _ENSURED_BUCKETS:
+        return
+    target_root.mkdir(parents=True, exist_ok=True)
+    with _ENSURED_LOCK:
+        _ENSURED_BUCKETS.add(bucket)
 
 
-def _persist_artifacts(artifacts: Dict[str, Path | None], bucket: str) -> Dict[str, str]:
+def _persist_artifacts(artifacts: Dict[str, Path | None], bucket: str, move: bool = False) -> Dict[str, str]:
+    """Store artifacts under tasks_output/<bucket>; ``move`` renames instead of copying when the source is disposable."""
     saved: Dict[str, str] = {}
     if not artifacts:
         return saved
 
     target_root = ARTIFACTS_ROOT / bucket / "software_copyright_output"
-    target_root.mkdir(parents=True, exist_ok=True)
 
     sign_pdf = artifacts.get("sign_page_pdf")
     if isinstance(sign_pdf, Path) and sign_pdf.exists():
+        # 只有真正有产物时才建目录，不再事后回收空目录
+        _ensure_bucket_dir(bucket, target_root)
         destination = target_root / sign_pdf.name
-        shutil.copy2(sign_pdf, destination)
+        moved = False
+        if move:
+            # 同一文件系统内直接改名，省掉整份 PDF 的读写；跨设备时回退为复制
+            try:
+                os.replace(sign_pdf, destination)
+                moved = True
+            except OSError:
+                pass
+        if not moved:
+            with sign_pdf.open("rb") as src, destination.open("wb") as dst:
+                _fast_copy(src, dst)
+            shutil.copystat(sign_pdf, destination)
         saved["sign_page_pdf"] = _relative_to_project(destination)
-
-    if not saved:
-        # 如果没有可保存的产物，可以回收空目录
-        try:
-            target_root.rmdir()
-        except OSError:
-            pass
+        _SIGN_PDF_CACHE.pop(bucket, None)
     return saved
 
 
+def _cached_sign_pdf_path(bucket: str, filename: str | None = None) -> Path | None:
+    """_resolve_sign_pdf_path with a short TTL; _persist_artifacts drops a bucket's entries when a new PDF lands."""
+    now = time.monotonic()
+    entries = _SIGN_PDF_CACHE.get(bucket)
+    hit = entries.get(filename) if entries else None
+    if hit and hit[0] > now:
+        return hit[1]
+    target = _resolve_sign_pdf_path(bucket, filename)
+    # 只缓存命中结果；未找到时下次请求仍重新查找
+    if target is not None:
+        if len(_SIGN_PDF_CACHE) >= SIGN_PDF_CACHE_LIMIT and bucket not in _SIGN_PDF_CACHE:
+            _SIGN_PDF_CACHE.clear()
+        _SIGN_PDF_CACHE.setdefault(bucket, {})[filename] = (now + SIGN_PDF_CACHE_TTL, target)
+    return target
+
+
 def _resolve_sign_pdf_path(bucket: str, filename: str | None = None) -> Path | None:
+    # 目录不存在时由下面的 exists()/scandir 自然落空，不再单独 stat 一次
     base = (ARTIFACTS_ROOT / bucket / "software_copyright_output").resolve()
-    if not base.exists() or not base.is_dir():
-        return None
-
     if filename:
         candidate = (base / filename).resolve()
         try:
@@ -115,52 +324,305 @@ def _resolve_sign_pdf_path(bucket: str, filename: str | None = None) -> Path | N
             raise HTTPException(status_code=400, detail="文件名非法")
         return candidate if candidate.exists() else None
 
-    pdfs = sorted(base.glob("*_签章页.pdf"), key=lambda p: p.stat().st_mtime)
-    return pdfs[-1] if pdfs else None
+    return _latest_sign_pdf(base)
+
+
+def _latest_sign_pdf(base: Path) -> Path | None:
+    """Newest *_签章页.pdf in ``base``: one scandir pass using the cached DirEntry stat, no sort."""
+    best: str | None = None
+    best_mtime = -1.0
+    try:
+        entries = os.scandir(base)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith("_签章页.pdf") or not entry.is_file():
+                continue
+            mtime = entry.stat().st_mtime
+            if mtime > best_mtime:
+                best_mtime, best = mtime, entry.path
+    return Path(best) if best else None
+
+
+def _read_inline_archive(zip_path: str) -> bytes | None:
+    path = Path(zip_path)
+    if path.stat().st_size > WS_INLINE_ZIP_LIMIT:
+        return None
+    return path.read_bytes()
+
+
+async def _split_archive(task: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes | None]:
+    """Return the wire payload of a queued task and its inline ZIP bytes read from disk, if any.
+
+    ZIPs above WS_INLINE_ZIP_LIMIT are not read; the payload then carries no blob even though the task has one.
+    """
+    zip_path = task.get("zip_path")
+    if not zip_path:
+        return task, None
+    payload = {k: v for k, v in task.items() if k != "zip_path"}
+    blob = await run_in_threadpool(_read_inline_archive, zip_path)
+    return payload, blob
+
+
+def _ws_archive_url(websocket: WebSocket, task_id: str) -> str:
+    # 与 /task 轮询返回的 zip_url 同源，只是把 WebSocket 的 ws/wss 换回 http/https
+    url = websocket.url_for("download_task_archive", task_id=task_id)
+    return str(url.replace(scheme="https" if url.scheme == "wss" else "http"))
 
 
 def _build_ws_url(request: Request) -> str:
     base_url = request.base_url
-    scheme = "wss" if base_url.scheme == "https" else "ws"
-    port = f":{base_url.port}" if base_url.port else ""
-    return f"{scheme}://{base_url.hostname}{port}/agent/ws"
+    return _ws_url_cached(base_url.scheme, base_url.hostname, base_url.port)
+
+
+@functools.lru_cache(maxsize=8)
+def _ws_url_cached(scheme: str, hostname: str | None, port: int | None) -> str:
+    ws_scheme = "wss" if scheme == "https" else "ws"
+    port_part = f":{port}" if port else ""
+    return f"{ws_scheme}://{hostname}{port_part}/agent/ws"
 
 
 @app.on_event("startup")
 def _prepare() -> None:
     ensure_storage_state_file()
+    _LOG_LISTENER.start()
+
+
+@app.on_event("shutdown")
+def _flush_logs() -> None:
+    _LOG_LISTENER.stop()
+
 
+class _UploaderSlot:
+    """A pooled TaskUploader pinned to its own thread; Playwright's sync API must stay on one thread."""
 
-def _api_response(data: Dict[str, Any] | None, message: str, success: bool = True, status_code: int = 200) -> JSONResponse:
+    # 上传以网络/浏览器等待为主，放在线程里即可，不要改成进程池：每个进程要多占一份解释器内存，
+    # 且 TaskUploader 的可变状态（浏览器、上下文、最近登录账号）只属于单个实例，同一时刻只有持有该槽位的请求在用；
+    # 登录态文件也按槽位分开，否则各槽位并发写入同一份 storage_state，读到的登录账号与自己的上下文对不上
+    __slots__ = ("executor", "uploader", "index")
+
+    def __init__(self, index: int) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"uploader-{index}")
+        self.uploader: TaskUploader | None = None
+        self.index = index
+
+    def upload(self, task: Task, log: Any) -> Dict[str, Path | None]:
+        if self.uploader is None:
+            self.uploader = TaskUploader(
+                headless=DEFAULT_HEADLESS,
+                storage_state=AUTH_DIR / f"storage_state_uploader{self.index}.json",
+                storage_meta=AUTH_DIR / f"storage_meta_uploader{self.index}.json",
+            )
+        try:
+            return self.uploader.upload(task, log)
+        except Exception:
+            # 失败后浏览器状态不可预期，关闭后下次重新启动
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.uploader is not None:
+            self.uploader.close()
+            self.uploader = None
+
+
+_UPLOADER_POOL: "asyncio.Queue[_UploaderSlot]" = asyncio.Queue()
+
+
+@app.on_event("startup")
+def _init_uploader_pool() -> None:
+    # 浏览器在各自线程首次上传时才启动，服务启动不受影响
+    for index in range(UPLOADER_POOL_SIZE):
+        _UPLOADER_POOL.put_nowait(_UploaderSlot(index))
+
+
+@app.on_event("shutdown")
+async def _close_uploader_pool() -> None:
+    loop = asyncio.get_running_loop()
+    while not _UPLOADER_POOL.empty():
+        slot = _UPLOADER_POOL.get_nowait()
+        try:
+            await loop.run_in_executor(slot.executor, slot.close)
+        finally:
+            slot.executor.shutdown(wait=False)
+
+
+@app.on_event("startup")
+async def _tune_threadpool() -> None:
+    # run_in_threadpool 走 anyio 的默认限流器（默认 40），上传流程以 IO 等待为主，放宽到 THREAD_TOKENS；
+    # 多 worker 启动时每个进程各自生效
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREAD_TOKENS
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREAD_TOKENS, thread_name_prefix="rzapply-io")
+    )
+
+
+@app.on_event("startup")
+async def _start_reaper() -> None:
+    app.state.reaper = asyncio.create_task(_reap_loop())
+
+
+async def _reap_loop() -> None:
+    while True:
+        await asyncio.sleep(AGENT_REAP_INTERVAL)
+        try:
+            await _reap_stale_agents()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("[reaper] sweep failed: %s", exc)
+
+
+async def _reap_stale_agents() -> None:
+    """Forget HTTP agents whose heartbeat went silent and requeue the tasks they were running."""
+    now = time.monotonic()
+    async with AGENT_CLIENTS_LOCK:
+        # WebSocket 连接的生命周期由断线处理负责，这里只清理轮询模式的 agent
+        stale = [
+            cid
+            for cid, client in AGENT_CLIENTS.items()
+            if now - client.last_seen > client.stale_after and cid not in AGENT_WS_CONNECTIONS
+        ]
+        for cid in stale:
+            AGENT_CLIENTS.pop(cid, None)
+    if not stale:
+        return
+    stale_ids = set(stale)
+    requeue_tasks: List[Dict[str, Any]] = []
+    async with AGENT_LOCK:
+        for task_id, info in list(AGENT_RUNNING_TASKS.items()):
+            if info.get("client_id") in stale_ids:
+                requeue_tasks.append(AGENT_RUNNING_TASKS.pop(task_id)["task"])
+                AGENT_REAPED_TASKS[task_id] = info["client_id"]
+        while len(AGENT_REAPED_TASKS) > AGENT_REAPED_TASKS_LIMIT:
+            AGENT_REAPED_TASKS.popitem(last=False)
+    logger.info("[reaper] dropped stale clients=%s requeued=%d", stale, len(requeue_tasks))
+    for task in requeue_tasks:
+        await _requeue_task(task)
+    if requeue_tasks:
+        await _dispatch_tasks()
+
+
+# 固定外壳的消息预先拼好前缀，只编码变化的 payload；无 payload 的帧整条复用
+_WS_FRAME_PREFIX = {
+    msg_type: b'{"type":"' + msg_type.encode() + b'","payload":'
+    for msg_type in ("task", "task_batch", "register_ack", "result_ack", "error")
+}
+_WS_HEARTBEAT_ACK = '{"type":"heartbeat_ack"}'
+
+
+def _ws_frame(msg_type: str, payload: Any) -> str:
+    # agent 约定 JSON 走文本帧、ZIP 走二进制帧，这里编码后按文本发送
+    return (_WS_FRAME_PREFIX[msg_type] + orjson.dumps(payload) + b"}").decode()
+
+
+async def _ws_recv(ws: WebSocket) -> Any:
+    message = await ws.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    data = message.get("text")
+    if data is None:
+        data = message.get("bytes") or b""
+    return orjson.loads(data)
+
+
+def _api_response(data: Dict[str, Any] | None, message: str, success: bool = True, status_code: int = 200) -> ORJSONResponse:
     payload = {
         "code": 0 if success else 1,
         "messages": message,
         "data": data or {},
     }
-    return JSONResponse(content=payload, status_code=status_code)
+    return ORJSONResponse(content=payload, status_code=status_code)
+
+
+# 错误响应只有 messages 不同；data 的空 dict 只读共享，序列化时不会被修改
+_ERROR_TEMPLATE: Dict[str, Any] = {"code": 1, "messages": None, "data": {}}
+
+
+def _error_response(message: str, status_code: int) -> ORJSONResponse:
+    body = _ERROR_TEMPLATE.copy()
+    body["messages"] = message
+    return ORJSONResponse(content=body, status_code=status_code)
 
 
 @app.exception_handler(HTTPException)
-async def _http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
-    return _api_response(None, str(exc.detail), success=False, status_code=exc.status_code)
+async def _http_exception_handler(request: Request, exc: HTTPException) -> ORJSONResponse:
+    return _error_response(str(exc.detail), exc.status_code)
 
 
 @app.exception_handler(Exception)
-async def _generic_exception_handler(request: Request, exc: Exception) -> JSONResponse:  # noqa: BLE001
-    return _api_response(None, f"服务器内部错误：{exc}", success=False, status_code=500)
+async def _generic_exception_handler(request: Request, exc: Exception) -> ORJSONResponse:  # noqa: BLE001
+    return _error_response(f"服务器内部错误：{exc}", 500)
 
 
 @app.get("/health")
-def health() -> JSONResponse:
+def health() -> ORJSONResponse:
     return _api_response({"status": "ok"}, "ok")
 
 
 @app.get("/files/sign-page/{bucket}")
 def download_sign_page(bucket: str, filename: str | None = None) -> FileResponse:
-    target = _resolve_sign_pdf_path(bucket, filename)
+    target = _cached_sign_pdf_path(bucket, filename)
     if not target:
         raise HTTPException(status_code=404, detail="未找到签章页文件")
-    return FileResponse(path=target, filename=target.name, media_type="application/pdf")
+    # 这里 stat 一次交给 FileResponse，Starlette 不再重复 stat；缓存期内文件被删时顺带失效缓存
+    try:
+        stat_result = target.stat()
+    except FileNotFoundError:
+        _SIGN_PDF_CACHE.pop(bucket, None)
+        raise HTTPException(status_code=404, detail="未找到签章页文件")
+    return FileResponse(
+        path=target,
+        stat_result=stat_result,
+        filename=target.name,
+        media_type="application/pdf",
+        headers={"Cache-Control": f"max-age={SIGN_PDF_CACHE_TTL}"},
+    )
+
+
+@dataclass(slots=True)
+class AgentClient:
+    """In-memory record of a registered agent; mutated on every heartbeat, so kept slot-based."""
+
+    client_id: str
+    hostname: str
+    platform: str
+    python_version: str
+    headless: bool | None
+    status: str = "idle"
+    task_id: str | None = None
+    last_seen: float = field(default_factory=time.monotonic)
+    stale_after: float = AGENT_STALE_SECONDS
+
+    @classmethod
+    def from_register(cls, client_id: str, payload: RegisterPayload) -> AgentClient:
+        stale_after = AGENT_STALE_SECONDS
+        if payload.heartbeat_interval:
+            stale_after = max(stale_after, AGENT_STALE_FACTOR * payload.heartbeat_interval)
+        return cls(
+            client_id=client_id,
+            hostname=payload.hostname or "",
+            platform=payload.platform or "",
+            python_version=payload.python_version or "",
+            headless=payload.headless,
+            stale_after=stale_after,
+        )
+
+
+@dataclass(slots=True)
+class AgentConnection:
+    """A live agent WebSocket plus its bounded outbox; a dedicated writer task drains the outbox."""
+
+    websocket: WebSocket
+    outbox: "asyncio.Queue[str | bytes]"
+    writer: asyncio.Task | None = None
+
+    def send(self, *frames: str | bytes) -> bool:
+        """Queue frames back to back without blocking; False when the outbox cannot take all of them."""
+        if self.outbox.maxsize - self.outbox.qsize() < len(frames):
+            return False
+        for frame in frames:
+            self.outbox.put_nowait(frame)
+        return True
 
 
 class RegisterPayload(BaseModel):
@@ -169,6 +631,7 @@ class RegisterPayload(BaseModel):
     platform: str | None = None
     python_version: str | None = None
     headless: bool | None = None
+    heartbeat_interval: float | None = Field(None, gt=0)
 
 
 class HeartbeatPayload(BaseModel):
@@ -198,57 +661,92 @@ class EnqueueTaskPayload(BaseModel):
 
 
 def _require_agent_auth(request: Request) -> None:
-    if not AGENT_TOKEN:
+    """Route dependency guarding agent endpoints; no-op when RZAPPLY_AGENT_TOKEN is unset."""
+    if _EXPECTED_AUTH is None:
         return
-    auth_header = request.headers.get("Authorization")
-    if auth_header != f"Bearer {AGENT_TOKEN}":
+    auth_header = request.headers.get("Authorization") or ""
+    if not hmac.compare_digest(auth_header.encode(), _EXPECTED_AUTH):
         raise HTTPException(status_code=401, detail="unauthorized")
 
 
+AGENT_AUTH = [Depends(_require_agent_auth)]
+
+
 async def _record_task_result(payload: TaskResultPayload) -> None:
     async with AGENT_LOCK:
-        AGENT_RESULTS[payload.task_id] = payload.dict()
-        AGENT_RUNNING_TASKS.pop(payload.task_id, None)
+        info = AGENT_RUNNING_TASKS.get(payload.task_id)
+        if info is not None and info.get("client_id") != payload.client_id:
+            stale = True
+        elif info is None and AGENT_REAPED_TASKS.get(payload.task_id) == payload.client_id:
+            stale = True
+        else:
+            stale = False
+            AGENT_RUNNING_TASKS.pop(payload.task_id, None)
+            AGENT_REAPED_TASKS.pop(payload.task_id, None)
+    if stale:
+        # 任务已因该 agent 失联被重新排队（可能已交给别的 agent），迟到的结果不再记录
+        logger.warning("[result] ignore late result task=%s client=%s", payload.task_id, payload.client_id)
+        return
+    async with AGENT_WS_LOCK:
+        if payload.client_id in AGENT_CLIENTS and payload.client_id in AGENT_WS_CONNECTIONS:
+            AGENT_WS_IDLE[payload.client_id] = None
+    async with AGENT_CLIENTS_LOCK:
         client = AGENT_CLIENTS.get(payload.client_id)
         if client:
-            client["status"] = "idle"
-            client["task_id"] = None
-            client["last_seen"] = datetime.utcnow().isoformat()
-            if payload.client_id in AGENT_WS_CONNECTIONS:
-                AGENT_WS_IDLE.add(payload.client_id)
+            client.status = "idle"
+            client.task_id = None
+            client.last_seen = time.monotonic()
+    result = payload.model_dump() if hasattr(payload, "model_dump") else payload.dict()
+    if len(result["logs"]) > AGENT_RESULT_LOG_LINES:
+        result["logs"] = result["logs"][-AGENT_RESULT_LOG_LINES:]
+    encoded = orjson.dumps(result)
+    async with AGENT_RESULTS_LOCK:
+        AGENT_RESULTS[payload.task_id] = encoded
+        AGENT_RESULTS.move_to_end(payload.task_id)
+        while len(AGENT_RESULTS) > AGENT_RESULTS_LIMIT:
+            AGENT_RESULTS.popitem(last=False)
+    if info:
+        await run_in_threadpool(_discard_archive, info["task"])
     await _dispatch_tasks()
 
 
 async def _requeue_task(task: Dict[str, Any]) -> None:
     async with AGENT_LOCK:
         AGENT_PENDING_TASKS.appendleft(task)
+        AGENT_TASKS_READY.notify()
 
 
 async def _mark_client_idle(client_id: str) -> None:
-    async with AGENT_LOCK:
+    async with AGENT_WS_LOCK:
         if client_id in AGENT_WS_CONNECTIONS:
-            AGENT_WS_IDLE.add(client_id)
+            AGENT_WS_IDLE[client_id] = None
+    async with AGENT_CLIENTS_LOCK:
         client = AGENT_CLIENTS.get(client_id)
         if client:
-            client["status"] = "idle"
-            client["task_id"] = None
-            client["last_seen"] = datetime.utcnow().isoformat()
+            client.status = "idle"
+            client.task_id = None
+            client.last_seen = time.monotonic()
 
 
 async def _drop_ws_connection(client_id: str) -> None:
     requeue_tasks: List[Dict[str, Any]] = []
+    # 先摘掉连接，之后的派发不会再选中它，再回收它手上的任务
+    async with AGENT_WS_LOCK:
+        conn = AGENT_WS_CONNECTIONS.pop(client_id, None)
+        AGENT_WS_IDLE.pop(client_id, None)
+    if conn and conn.writer:
+        conn.writer.cancel()
     async with AGENT_LOCK:
-        AGENT_WS_CONNECTIONS.pop(client_id, None)
-        AGENT_WS_IDLE.discard(client_id)
         for task_id, info in list(AGENT_RUNNING_TASKS.items()):
             if info.get("client_id") == client_id and info.get("channel") == "ws":
                 requeue_tasks.append(info["task"])
                 AGENT_RUNNING_TASKS.pop(task_id, None)
+    async with AGENT_CLIENTS_LOCK:
         client = AGENT_CLIENTS.get(client_id)
         if client:
-            client["status"] = "offline"
-            client["task_id"] = None
-            client["last_seen"] = datetime.utcnow().isoformat()
+            client.status = "offline"
+            client.task_id = None
+            client.last_seen = time.monotonic()
     for task in requeue_tasks:
         await _requeue_task(task)
     if requeue_tasks:
@@ -257,13 +755,11 @@ async def _drop_ws_connection(client_id: str) -> None:
 
 async def _dispatch_tasks() -> None:
     assignments: List[Tuple[str, Dict[str, Any]]] = []
-    async with AGENT_LOCK:
-        idle_clients = [cid for cid in AGENT_WS_IDLE if cid in AGENT_WS_CONNECTIONS]
-        print(f"[dispatch] pending={len(AGENT_PENDING_TASKS)} idle_clients={idle_clients}")
-        while AGENT_PENDING_TASKS and idle_clients:
-            client_id = idle_clients.pop(0)
-            ws = AGENT_WS_CONNECTIONS.get(client_id)
-            if not ws:
+    async with AGENT_LOCK, AGENT_WS_LOCK:
+        pending_count, idle_count = len(AGENT_PENDING_TASKS), len(AGENT_WS_IDLE)
+        while AGENT_PENDING_TASKS and AGENT_WS_IDLE:
+            client_id, _ = AGENT_WS_IDLE.popitem(last=False)
+            if client_id not in AGENT_WS_CONNECTIONS:
                 continue
             task = AGENT_PENDING_TASKS.popleft()
             task_id = str(task.get("task_id") or uuid.uuid4().hex)
@@ -271,45 +767,83 @@ async def _dispatch_tasks() -> None:
             AGENT_RUNNING_TASKS[task_id] = {
                 "client_id": client_id,
                 "task": task,
-                "started_at": datetime.utcnow().isoformat(),
+                "started_at": time.monotonic(),
                 "channel": "ws",
             }
-            client = AGENT_CLIENTS.get(client_id)
-            if client:
-                client["status"] = "running"
-                client["task_id"] = task_id
-                client["last_seen"] = datetime.utcnow().isoformat()
-            AGENT_WS_IDLE.discard(client_id)
-            print(f"[dispatch] assign task_id={task_id} -> client={client_id}")
             assignments.append((client_id, task))
+    logger.info("[dispatch] pending=%d idle_clients=%d assigned=%d", pending_count, idle_count, len(assignments))
+    if assignments:
+        async with AGENT_CLIENTS_LOCK:
+            for client_id, task in assignments:
+                client = AGENT_CLIENTS.get(client_id)
+                if client:
+                    client.status = "running"
+                    client.task_id = task["task_id"]
+                    client.last_seen = time.monotonic()
+    batches: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
     for client_id, task in assignments:
-        ws = AGENT_WS_CONNECTIONS.get(client_id)
-        if not ws:
-            await _requeue_task(task)
+        batches[client_id].append(task)
+    for client_id, tasks in batches.items():
+        conn = AGENT_WS_CONNECTIONS.get(client_id)
+        task_ids = [task.get("task_id") for task in tasks]
+        if not conn:
+            for task in tasks:
+                await _requeue_task(task)
             continue
         try:
-            await ws.send_json({"type": "task", "payload": task})
-            print(f"[dispatch] sent task_id={task.get('task_id')} to {client_id}")
+            payloads: List[Dict[str, Any]] = []
+            blobs: List[bytes] = []
+            for task in tasks:
+                payload, blob = await _split_archive(task)
+                # 内联 ZIP 以二进制帧紧随任务消息发送，避免 base64 膨胀；多个 ZIP 按任务顺序依次发送
+                if blob is not None:
+                    payload["zip_binary"] = True
+                    blobs.append(blob)
+                elif task.get("zip_path"):
+                    payload["zip_url"] = _ws_archive_url(conn.websocket, task["task_id"])
+                payloads.append(payload)
+            if len(payloads) == 1:
+                frame = _ws_frame("task", payloads[0])
+            else:
+                frame = _ws_frame("task_batch", {"tasks": payloads})
+            # 任务帧和紧随的 ZIP 帧一次性入队，保证在连接上连续发送
+            if not conn.send(frame, *blobs):
+                raise RuntimeError("send queue full")
+            logger.info("[dispatch] sent task_ids=%s to %s", task_ids, client_id)
         except Exception:
-            print(f"[dispatch] failed to send task_id={task.get('task_id')} to {client_id}, requeueing")
-            await _requeue_task(task)
+            logger.warning("[dispatch] failed to send task_ids=%s to %s, requeueing", task_ids, client_id)
+            for task in tasks:
+                await _requeue_task(task)
             await _drop_ws_connection(client_id)
+            try:
+                await conn.websocket.close(code=1013)
+            except Exception:  # noqa: BLE001
+                pass
+
+
+def _schedule_dispatch() -> None:
+    """Coalesce dispatch requests made within one loop tick into a single _dispatch_tasks sweep."""
+    global _DISPATCH_SCHEDULED
+    if _DISPATCH_SCHEDULED:
+        return
+    _DISPATCH_SCHEDULED = True
+    asyncio.get_running_loop().call_soon(_run_scheduled_dispatch)
 
 
-@app.post("/register")
+def _run_scheduled_dispatch() -> None:
+    global _DISPATCH_SCHEDULED
+    _DISPATCH_SCHEDULED = False
+    task = asyncio.ensure_future(_dispatch_tasks())
+    # 事件循环只持有弱引用，需要自己保存直到完成
+    _DISPATCH_RUNS.add(task)
+    task.add_done_callback(_DISPATCH_RUNS.discard)
+
+
+@app.post("/register", dependencies=AGENT_AUTH)
 async def register_agent(payload: RegisterPayload, request: Request) -> Dict[str, Any]:
-    _require_agent_auth(request)
     client_id = payload.client_id or uuid.uuid4().hex
-    client_data = {
-        "client_id": client_id,
-        "hostname": payload.hostname or "",
-        "platform": payload.platform or "",
-        "python_version": payload.python_version or "",
-        "headless": payload.headless,
-        "status": "idle",
-        "last_seen": datetime.utcnow().isoformat(),
-    }
-    async with AGENT_LOCK:
+    client_data = AgentClient.from_register(client_id, payload)
+    async with AGENT_CLIENTS_LOCK:
         AGENT_CLIENTS[client_id] = client_data
     response = {
         "client_id": client_id,
@@ -319,29 +853,108 @@ async def register_agent(payload: RegisterPayload, request: Request) -> Dict[str
     return response
 
 
+async def _ws_writer(conn: AgentConnection) -> None:
+    websocket = conn.websocket
+    outbox = conn.outbox
+    try:
+        while True:
+            frame = await outbox.get()
+            if isinstance(frame, str):
+                await websocket.send_text(frame)
+            else:
+                await websocket.send_bytes(frame)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:  # noqa: BLE001
+        # 发送失败时关闭连接，接收循环随之退出并回收任务
+        logger.warning("[agent-ws] send failed: %s", exc)
+        try:
+            await websocket.close(code=1011)
+        except Exception:  # noqa: BLE001
+            pass
+
+
+def _ws_push(conn: AgentConnection, frame: str) -> None:
+    if not conn.send(frame):
+        raise RuntimeError("send queue full")
+
+
+async def _ws_on_heartbeat(conn: AgentConnection, client_id: str, payload: Dict[str, Any]) -> None:
+    async with AGENT_CLIENTS_LOCK:
+        client = AGENT_CLIENTS.get(client_id)
+        if client:
+            client.status = payload.get("status", client.status)
+            client.task_id = payload.get("task_id")
+            client.last_seen = time.monotonic()
+    if client and payload.get("status") == "idle":
+        async with AGENT_WS_LOCK:
+            AGENT_WS_IDLE[client_id] = None
+    # 队列满时丢弃 heartbeat_ack 即可，agent 不依赖它
+    conn.send(_WS_HEARTBEAT_ACK)
+    if payload.get("status") == "idle":
+        await _dispatch_tasks()
+
+
+async def _ws_on_task_ack(conn: AgentConnection, client_id: str, payload: Dict[str, Any]) -> None:
+    task_id = payload.get("task_id")
+    if not task_id or payload.get("accepted", True):
+        return
+    async with AGENT_LOCK:
+        info = AGENT_RUNNING_TASKS.pop(task_id, None)
+    if info:
+        await _requeue_task(info["task"])
+    # busy 表示 agent 本地队列已满, 等它心跳回报 idle 再派发, 避免来回推送同一任务
+    if payload.get("reason") != "busy":
+        await _mark_client_idle(client_id)
+    await _dispatch_tasks()
+
+
+async def _ws_on_result(conn: AgentConnection, client_id: str, payload: Dict[str, Any]) -> None:
+    result_payload = dict(payload)
+    result_payload["client_id"] = client_id
+    try:
+        result_model = TaskResultPayload(**result_payload)
+    except ValidationError as exc:
+        _ws_push(conn, _ws_frame("error", {"message": f"invalid result payload: {exc}"}))
+        return
+    await _record_task_result(result_model)
+    _ws_push(conn, _ws_frame("result_ack", {"task_id": result_model.task_id}))
+
+
+async def _ws_on_log(conn: AgentConnection, client_id: str, payload: Dict[str, Any]) -> None:
+    # 暂时仅打印日志，后续可持久化
+    log_line = payload.get("message")
+    if log_line:
+        logger.info("[agent-log %s] %s", client_id, log_line)
+
+
+# 按消息类型分发 agent 发来的 WS 消息，替代逐个比较的 if/elif 链
+_WS_HANDLERS = {
+    "heartbeat": _ws_on_heartbeat,
+    "task_ack": _ws_on_task_ack,
+    "result": _ws_on_result,
+    "log": _ws_on_log,
+}
+
+
 @app.websocket("/agent/ws")
 async def agent_ws_endpoint(websocket: WebSocket) -> None:
-    if AGENT_TOKEN:
-        auth_header = websocket.headers.get("Authorization")
-        token_ok = False
-        if auth_header == f"Bearer {AGENT_TOKEN}":
-            token_ok = True
-        else:
+    if _EXPECTED_AUTH is not None:
+        auth_header = websocket.headers.get("Authorization") or ""
+        token_ok = hmac.compare_digest(auth_header.encode(), _EXPECTED_AUTH)
+        if not token_ok:
             # allow token provided as query parameter for clients that cannot set headers
-            try:
-                token_q = websocket.query_params.get("token")
-                if token_q == AGENT_TOKEN:
-                    token_ok = True
-            except Exception:
-                token_ok = False
+            token_q = websocket.query_params.get("token") or ""
+            token_ok = hmac.compare_digest(token_q.encode(), _EXPECTED_TOKEN)
         if not token_ok:
             await websocket.close(code=4401, reason="unauthorized")
             return
 
     await websocket.accept()
     client_id: Optional[str] = None
+    conn: Optional[AgentConnection] = None
     try:
-        register_packet = await websocket.receive_json()
+        register_packet = await _ws_recv(websocket)
         if not isinstance(register_packet, dict) or register_packet.get("type") != "register":
             await websocket.close(code=4400, reason="first message must be register")
             return
@@ -353,125 +966,121 @@ async def agent_ws_endpoint(websocket: WebSocket) -> None:
             return
 
         client_id = payload.client_id or uuid.uuid4().hex
-        client_data = {
-            "client_id": client_id,
-            "hostname": payload.hostname or "",
-            "platform": payload.platform or "",
-            "python_version": payload.python_version or "",
-            "headless": payload.headless,
-            "status": "idle",
-            "last_seen": datetime.utcnow().isoformat(),
-        }
+        client_data = AgentClient.from_register(client_id, payload)
+
+        conn = AgentConnection(websocket, asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE))
+        conn.writer = asyncio.create_task(_ws_writer(conn))
 
-        async with AGENT_LOCK:
+        async with AGENT_CLIENTS_LOCK:
             AGENT_CLIENTS[client_id] = client_data
-            AGENT_WS_CONNECTIONS[client_id] = websocket
-            AGENT_WS_IDLE.add(client_id)
-
-        await websocket.send_json(
-            {
-                "type": "register_ack",
-                "payload": {
-                    "client_id": client_id,
-                    "heartbeat_interval": 30,
-                    "supports_ws": True,
-                },
-            }
-        )
+        async with AGENT_WS_LOCK:
+            AGENT_WS_CONNECTIONS[client_id] = conn
+            AGENT_WS_IDLE[client_id] = None
+
+        _ws_push(conn, _ws_frame("register_ack", {"client_id": client_id, "heartbeat_interval": 30, "supports_ws": True}))
         await _dispatch_tasks()
 
         while True:
-            message = await websocket.receive_json()
+            message = await _ws_recv(websocket)
             if not isinstance(message, dict):
                 continue
             msg_type = message.get("type")
             payload = message.get("payload") or {}
-
-            if msg_type == "heartbeat":
-                async with AGENT_LOCK:
-                    client = AGENT_CLIENTS.get(client_id)
-                    if client:
-                        client["status"] = payload.get("status", client["status"])
-                        client["task_id"] = payload.get("task_id")
-                        client["last_seen"] = datetime.utcnow().isoformat()
-                        if payload.get("status") == "idle":
-                            AGENT_WS_IDLE.add(client_id)
-                await websocket.send_json({"type": "heartbeat_ack"})
-                if payload.get("status") == "idle":
-                    await _dispatch_tasks()
-            elif msg_type == "task_ack":
-                task_id = payload.get("task_id")
-                accepted = payload.get("accepted", True)
-                if not task_id:
-                    continue
-                if not accepted:
-                    info = None
-                    async with AGENT_LOCK:
-                        info = AGENT_RUNNING_TASKS.pop(task_id, None)
-                    if info:
-                        await _requeue_task(info["task"])
-                    await _mark_client_idle(client_id)
-                    await _dispatch_tasks()
-            elif msg_type == "result":
-                result_payload = dict(payload or {})
-                result_payload["client_id"] = client_id
-                try:
-                    result_model = TaskResultPayload(**result_payload)
-                except ValidationError as exc:
-                    await websocket.send_json({"type": "error", "payload": {"message": f"invalid result payload: {exc}"}})
-                    continue
-                await _record_task_result(result_model)
-                await websocket.send_json({"type": "result_ack", "payload": {"task_id": result_model.task_id}})
-            elif msg_type == "log":
-                # 暂时仅打印日志，后续可持久化
-                log_line = payload.get("message")
-                if log_line:
-                    print(f"[agent-log {client_id}] {log_line}")
-            else:
-                await websocket.send_json({"type": "error", "payload": {"message": f"unknown message type: {msg_type}"}})
+            handler = _WS_HANDLERS.get(msg_type) if isinstance(msg_type, str) else None
+            if handler is None:
+                _ws_push(conn, _ws_frame("error", {"message": f"unknown message type: {msg_type}"}))
+                continue
+            await handler(conn, client_id, payload)
     except WebSocketDisconnect:
         pass
     except Exception as exc:  # noqa: BLE001
-        print(f"[agent-ws] connection error: {exc}")
+        logger.warning("[agent-ws] connection error: %s", exc)
     finally:
         if client_id:
             await _drop_ws_connection(client_id)
+        if conn and conn.writer:
+            conn.writer.cancel()
 
 
-@app.post("/heartbeat")
-async def heartbeat(payload: HeartbeatPayload, request: Request) -> Dict[str, Any]:
-    _require_agent_auth(request)
-    async with AGENT_LOCK:
+@app.post("/heartbeat", dependencies=AGENT_AUTH)
+async def heartbeat(payload: HeartbeatPayload) -> Dict[str, Any]:
+    async with AGENT_CLIENTS_LOCK:
         client = AGENT_CLIENTS.get(payload.client_id)
         if not client:
             raise HTTPException(status_code=404, detail="unknown client")
-        client["status"] = payload.status
-        client["task_id"] = payload.task_id
-        client["last_seen"] = datetime.utcnow().isoformat()
+        client.status = payload.status
+        client.task_id = payload.task_id
+        client.last_seen = time.monotonic()
     return {"ok": True}
 
 
-@app.post("/tasks/enqueue")
-async def enqueue_task(payload: EnqueueTaskPayload, request: Request) -> Dict[str, Any]:
-    _require_agent_auth(request)
+def _monotonic_to_iso(value: float, now_mono: float, now_wall: float) -> str:
+    return datetime.fromtimestamp(now_wall - (now_mono - value)).isoformat(timespec="seconds")
+
+
+@app.get("/debug/agents", dependencies=AGENT_AUTH)
+async def debug_agents() -> Dict[str, Any]:
+    # 锁内只做浅拷贝，格式化与序列化都放到锁外，避免调试请求拖慢派发
+    async with AGENT_LOCK:
+        pending_tasks = list(AGENT_PENDING_TASKS)
+        running_tasks = list(AGENT_RUNNING_TASKS.items())
+    async with AGENT_WS_LOCK:
+        ws_connections = list(AGENT_WS_CONNECTIONS)
+        ws_idle = list(AGENT_WS_IDLE)
+    async with AGENT_CLIENTS_LOCK:
+        client_items = [(cid, dataclasses.asdict(client)) for cid, client in AGENT_CLIENTS.items()]
+
+    now_mono, now_wall = time.monotonic(), time.time()
+    pending = [task.get("task_id") for task in pending_tasks]
+    running = {
+        task_id: {
+            "client_id": info["client_id"],
+            "channel": info.get("channel", "http"),
+            "started_at": _monotonic_to_iso(info["started_at"], now_mono, now_wall),
+        }
+        for task_id, info in running_tasks
+    }
+    clients = {}
+    for cid, client in client_items:
+        client["last_seen"] = _monotonic_to_iso(client["last_seen"], now_mono, now_wall)
+        clients[cid] = client
+    return {
+        "pending": pending,
+        "running": running,
+        "clients": clients,
+        "ws_connections": ws_connections,
+        "ws_idle": ws_idle,
+    }
+
+
+@app.post("/tasks/enqueue", dependencies=AGENT_AUTH)
+async def enqueue_task(payload: EnqueueTaskPayload) -> Dict[str, Any]:
     if not payload.zip_url and not payload.zip_base64:
         raise HTTPException(status_code=400, detail="zip_url 或 zip_base64 至少提供一个")
 
     task_data = payload.dict()
     if not task_data.get("task_id"):
         task_data["task_id"] = uuid.uuid4().hex
+    if task_data.get("zip_base64"):
+        if len(task_data["zip_base64"]) // 4 * 3 > MAX_ZIP_BYTES:
+            raise HTTPException(status_code=413, detail=f"ZIP 文件过大：超过上限 {MAX_ZIP_BYTES} 字节")
+        try:
+            archive = await run_in_threadpool(_write_archive, task_data.pop("zip_base64"))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"zip_base64 不是合法 base64：{exc}") from exc
+        task_data["zip_path"] = str(archive)
 
     async with AGENT_LOCK:
         AGENT_PENDING_TASKS.append(task_data)
+        AGENT_TASKS_READY.notify()
         pending = len(AGENT_PENDING_TASKS)
-    await _dispatch_tasks()
+    _schedule_dispatch()
     return {"task_id": task_data["task_id"], "pending": pending}
 
 
-@app.post("/tasks/enqueue/upload")
+@app.post("/tasks/enqueue/upload", dependencies=AGENT_AUTH)
 async def enqueue_upload_task(
-    request: Request,
-    file: UploadFile = File(..., description="包含 meta.json 的任务 ZIP，上传后将转为 base64 放入队列"),
+    file: UploadFile = File(..., description="包含 meta.json 的任务 ZIP，上传后暂存到磁盘并放入队列"),
     task_id: str = Form(
         "",
         description="可选的业务任务 ID；留空时由服务器自动生成",
@@ -505,14 +1114,9 @@ async def enqueue_upload_task(
         description="覆盖 Agent 默认的 headless 运行模式；不填使用 Agent 自身配置",
     ),
 ) -> Dict[str, Any]:
-    _require_agent_auth(request)
     if not file.filename or not file.filename.lower().endswith(".zip"):
         raise HTTPException(status_code=400, detail="请上传 zip 文件")
 
-    blob = await file.read()
-    if not blob:
-        raise HTTPException(status_code=400, detail="上传文件为空")
-
     overrides: Dict[str, Any] = {
         "login_username": login_username,
         "login_password": login_password,
@@ -521,17 +1125,18 @@ async def enqueue_upload_task(
     }
 
     if config_json:
-        try:
-            extra = json.loads(config_json)
-        except json.JSONDecodeError as exc:
-            raise HTTPException(status_code=400, detail=f"config_json 不是合法 JSON：{exc}") from exc
-        if not isinstance(extra, dict):
-            raise HTTPException(status_code=400, detail="config_json 必须是 JSON 对象")
-        overrides.update(extra)
+        overrides.update(_parse_config_json(config_json))
+
+    # 分块写入暂存目录，不把整个 ZIP 读进内存
+    _check_upload_size(file)
+    archive = await run_in_threadpool(_persist_upload, file, ARCHIVE_DIR, f"{uuid.uuid4().hex}.zip")
+    if archive.stat().st_size == 0:
+        archive.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="上传文件为空")
 
     payload = {
         "task_id": task_id.strip() or uuid.uuid4().hex,
-        "zip_base64": base64.b64encode(blob).decode("ascii"),
+        "zip_path": str(archive),
         "zip_filename": Path(file.filename).name,
         "config": overrides,
         "cleanup": cleanup,
@@ -541,51 +1146,77 @@ async def enqueue_upload_task(
 
     async with AGENT_LOCK:
         AGENT_PENDING_TASKS.append(payload)
+        AGENT_TASKS_READY.notify()
         pending = len(AGENT_PENDING_TASKS)
-    await _dispatch_tasks()
+    _schedule_dispatch()
     return {"task_id": payload["task_id"], "pending": pending}
 
 
 async def _pop_agent_task(client_id: str, timeout: int) -> Dict[str, Any] | None:
-    deadline = time.monotonic() + max(timeout, 0)
-    while True:
-        async with AGENT_LOCK:
-            if AGENT_PENDING_TASKS:
-                task = AGENT_PENDING_TASKS.popleft()
-                task_id = str(task.get("task_id") or uuid.uuid4().hex)
-                task["task_id"] = task_id
-                AGENT_RUNNING_TASKS[task_id] = {
-                    "client_id": client_id,
-                    "task": task,
-                    "started_at": datetime.utcnow().isoformat(),
-                }
-                return task
-        if timeout <= 0 or time.monotonic() >= deadline:
-            return None
-        await asyncio.sleep(1)
-
-
-@app.get("/task")
-async def fetch_task(request: Request, client_id: str, timeout: int = 25):
     async with AGENT_LOCK:
+        if not AGENT_PENDING_TASKS:
+            if timeout <= 0:
+                return None
+            try:
+                await asyncio.wait_for(AGENT_TASKS_READY.wait_for(lambda: bool(AGENT_PENDING_TASKS)), timeout)
+            except asyncio.TimeoutError:
+                return None
+        task = AGENT_PENDING_TASKS.popleft()
+        task_id = str(task.get("task_id") or uuid.uuid4().hex)
+        task["task_id"] = task_id
+        AGENT_RUNNING_TASKS[task_id] = {
+            "client_id": client_id,
+            "task": task,
+            "started_at": time.monotonic(),
+        }
+        return task
+
+
+@app.get("/task", dependencies=AGENT_AUTH)
+async def fetch_task(request: Request, client_id: str, timeout: int = 25):
+    async with AGENT_CLIENTS_LOCK:
         if client_id not in AGENT_CLIENTS:
             raise HTTPException(status_code=404, detail="unknown client")
-    _require_agent_auth(request)
     task = await _pop_agent_task(client_id, timeout)
     if not task:
         return Response(status_code=204)
-    return task
+    zip_path = task.get("zip_path")
+    if not zip_path:
+        return task
+    # 暂存的 ZIP 不再 base64 内联，改为返回下载地址，由 Agent 流式落盘
+    payload = {k: v for k, v in task.items() if k != "zip_path"}
+    payload["zip_url"] = str(request.url_for("download_task_archive", task_id=task["task_id"]))
+    return payload
+
+
+@app.get("/tasks/{task_id}/archive", dependencies=AGENT_AUTH)
+async def download_task_archive(task_id: str) -> FileResponse:
+    async with AGENT_LOCK:
+        info = AGENT_RUNNING_TASKS.get(task_id)
+    zip_path = info["task"].get("zip_path") if info else None
+    if not zip_path or not Path(zip_path).exists():
+        raise HTTPException(status_code=404, detail="任务包不存在或任务已结束")
+    return FileResponse(path=zip_path, media_type="application/zip", filename=Path(zip_path).name)
+
 
+@app.get("/tasks/{task_id}/result", dependencies=AGENT_AUTH)
+async def get_task_result(task_id: str) -> Response:
+    async with AGENT_RESULTS_LOCK:
+        encoded = AGENT_RESULTS.get(task_id)
+    if encoded is None:
+        raise HTTPException(status_code=404, detail="任务结果不存在或已过期")
+    return Response(content=encoded, media_type="application/json")
 
-@app.post("/task_result")
-async def task_result(payload: TaskResultPayload, request: Request) -> Dict[str, Any]:
-    _require_agent_auth(request)
+
+@app.post("/task_result", dependencies=AGENT_AUTH)
+async def task_result(payload: TaskResultPayload) -> Dict[str, Any]:
     await _record_task_result(payload)
     return {"ok": True}
 
 
 @app.post("/tasks/upload")
 async def upload_task(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="包含 meta.json 的任务 ZIP，上传后会解压并读取任务元数据"),
     task_id: str = Form(
         "",
@@ -615,47 +1246,81 @@ async def upload_task(
         True,
         description="是否在任务完成后删除临时目录；设为 false 可保留解压出的文件以便排查",
     ),
-) -> JSONResponse:
+) -> ORJSONResponse:
     if not file.filename or not file.filename.lower().endswith(".zip"):
         raise HTTPException(status_code=400, detail="请上传包含 meta.json 的 ZIP 文件")
 
+    _check_upload_size(file)
+
     provided_task_id = task_id.strip()
     run_id = uuid.uuid4().hex
-    run_dir = RUNTIME_DIR / run_id
-
-    saved_zip = _persist_upload(file, run_dir)
-    loader = TaskLoader(run_dir)
-    tasks = loader.load_tasks()
-    if not tasks:
-        raise HTTPException(status_code=400, detail="未在 ZIP 中找到有效任务")
+    tmp_dir: tempfile.TemporaryDirectory | None = None
+    if cleanup:
+        tmp_dir = tempfile.TemporaryDirectory(dir=RUNTIME_DIR, prefix=f"{run_id}_")
+        run_dir = Path(tmp_dir.name)
+    else:
+        run_dir = RUNTIME_DIR / run_id
 
-    task = tasks[0]
     overrides: Dict[str, Any] = {
         "login_username": login_username,
         "login_password": login_password,
         "login_type": login_type,
         "submit_role": submit_role,
     }
+    try:
+        response = await _run_upload(file, run_dir, run_id, provided_task_id, cleanup, overrides, config_json)
+    except BaseException:
+        # 校验失败或请求被取消时响应不会发出, BackgroundTasks 不会执行；取消后不能再 await, 直接同步删除运行目录
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+        raise
+    if tmp_dir is not None:
+        # 响应发出后再删除运行目录, 不阻塞返回
+        background_tasks.add_task(tmp_dir.cleanup)
+    return response
+
 
+async def _run_upload(
+    file: UploadFile,
+    run_dir: Path,
+    run_id: str,
+    provided_task_id: str,
+    cleanup: bool,
+    overrides: Dict[str, Any],
+    config_json: str | None,
+) -> ORJSONResponse:
+    loader = TaskLoader(run_dir)
+    if cleanup:
+        # 直接从上传的临时文件解压，ZIP 本身不再落盘一次
+        tasks = [await run_in_threadpool(loader.load_from_stream, file.file, file.filename)]
+    else:
+        # 保留运行目录排查时连同原始 ZIP 一起留下
+        await run_in_threadpool(_persist_upload, file, run_dir)
+        tasks = await run_in_threadpool(loader.load_tasks)
+    if not tasks:
+        raise HTTPException(status_code=400, detail="未在 ZIP 中找到有效任务")
+
+    task = tasks[0]
     if config_json:
-        try:
-            extra = json.loads(config_json)
-        except json.JSONDecodeError as exc:
-            raise HTTPException(status_code=400, detail=f"config_json 不是合法 JSON：{exc}") from exc
-        if not isinstance(extra, dict):
-            raise HTTPException(status_code=400, detail="config_json 必须是 JSON 对象")
-        overrides.update(extra)
+        overrides.update(_parse_config_json(config_json))
 
     _apply_config_overrides(task, overrides)
 
     if not task.is_config_complete():
         raise HTTPException(status_code=400, detail="任务配置不完整：请提供 submit_role=申请人 或完整著作权人信息")
 
-    log_lines: List[str] = []
+    log_lines: deque[str] = deque(maxlen=LOG_LIMIT)
+    # [上次的整秒, 格式化后的时间戳, 是否丢弃过日志]
+    log_state: List[Any] = [-1, "", False]
 
     def _log(message: str) -> None:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_lines.append(f"[{timestamp}] {message}")
+        # 同一秒内的日志复用已格式化的时间戳
+        now = int(time.time())
+        if now != log_state[0]:
+            log_state[0], log_state[1] = now, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        if len(log_lines) == LOG_LIMIT:
+            log_state[2] = True
+        log_lines.append(f"[{log_state[1]}] {message}")
 
     result_status = "success"
     result_message = "上传成功，已打印签章页"
@@ -664,22 +1329,19 @@ async def upload_task(
     artifacts: Dict[str, Path | None] = {}
     saved_files: Dict[str, str] = {}
 
-    def _run_upload() -> Dict[str, Path | None]:
-        uploader = TaskUploader(headless=DEFAULT_HEADLESS)
-        return uploader.upload(task, _log)
-
     try:
-        artifacts = await run_in_threadpool(_run_upload)
-        saved_files = _persist_artifacts(artifacts, provided_task_id or run_id)
+        slot = await _UPLOADER_POOL.get()
+        try:
+            artifacts = await asyncio.get_running_loop().run_in_executor(slot.executor, slot.upload, task, _log)
+        finally:
+            _UPLOADER_POOL.put_nowait(slot)
+        saved_files = await run_in_threadpool(_persist_artifacts, artifacts, provided_task_id or run_id, cleanup)
         flow_number = artifacts.get("flow_number")
     except Exception as exc:  # noqa: BLE001
         result_status = "failed"
         result_message = f"上传失败：{exc}"
         http_status = 500
         flow_number = None
-    finally:
-        if cleanup:
-            shutil.rmtree(run_dir, ignore_errors=True)
 
     data = {
         "task_id": provided_task_id or None,
@@ -687,7 +1349,8 @@ async def upload_task(
         "task": task.display_name(),
         "status": result_status,
         "reason": result_message,
-        "logs": log_lines,
+        "logs": list(log_lines),
+        "logs_truncated": log_state[2],
         "files": saved_files,
         "flow_number": flow_number,
     }
@@ -697,4 +1360,6 @@ async def upload_task(
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("api_server.app:app", host="0.0.0.0", port=8000, reload=False, workers=1)
+    # agent 注册表、任务队列都在进程内存里，多 worker 之间不共享；只有纯 /tasks/upload 场景才适合调大
+    workers = int(os.environ.get("RZAPPLY_WORKERS", "1"))
+    uvicorn.run("api_server.app:app", host="0.0.0.0", port=8000, reload=False, workers=max(workers, 1))
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import functools
 import json
+import os
+import queue
 import sys
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
-from PySide6.QtCore import QObject, Qt, QThread, Signal, Slot, QTimer
+from PySide6.QtCore import QMutex, QObject, Qt, QThread, QThreadPool, Signal, Slot, QTimer
 from PySide6.QtGui import QTextCursor
 from PySide6.QtWidgets import (
     QApplication,
@@ -32,28 +36,101 @@ from models import DEFAULT_OWNER_TYPE, OWNER_TYPE_ID_OPTIONS, Task, TaskStatus
 from task_loader import TaskLoader
 from uploader import TaskUploader
 
+try:  # 打包 GUI 时可能只装了 playwright/pyside6, 缺少 orjson 时回退到标准库 json
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _dumps_json(value: Any) -> bytes:
+    """Indented UTF-8 JSON, non-ASCII kept as-is; same layout with either backend."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _dumps_meta(value: Any) -> str:
+    return _dumps_json(value).decode("utf-8")
+
+
+def _write_state_file(path: Path, data: bytes) -> None:
+    # 先写临时文件再替换，写到一半退出也不会留下损坏的 data.json
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _loads_meta(text: str) -> Any:
+    """Parse a meta JSON editor; both backends raise a ValueError subclass on bad input."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
 
 class UploadWorker(QObject):
     finished = Signal(Task, bool, str)
-    log = Signal(str)
+    # 日志先积在缓冲区里，只在缓冲区由空变为非空时通知一次，由界面定时批量取走
+    logs_available = Signal()
 
-    def __init__(self, task: Task, uploader: TaskUploader):
+    def __init__(self):
         super().__init__()
-        self.task = task
-        self.uploader = uploader
+        # 常驻一个线程和一个 TaskUploader，浏览器在多个任务间复用；Playwright 同步 API 只能在创建它的线程里用
+        self._tasks: queue.Queue[Task | None] = queue.Queue()
+        self._log_buf: deque[str] = deque()
+        self._log_lock = QMutex()
 
-    @Slot()
-    def run(self) -> None:
-        def emit_log(message: str) -> None:
-            text = f"{self.task.display_name()} · {message}"
-            self.log.emit(text)
-        emit_log("开始执行上传线程")
+    def submit(self, task: Task) -> None:
+        self._tasks.put(task)
+
+    def stop(self) -> None:
+        """Ask run_loop to exit after the current task; the uploader is closed on its own thread."""
+        self._tasks.put(None)
+
+    def take_logs(self) -> list[str]:
+        """Drain buffered log lines; called from the GUI thread."""
+        self._log_lock.lock()
+        try:
+            lines = list(self._log_buf)
+            self._log_buf.clear()
+        finally:
+            self._log_lock.unlock()
+        return lines
+
+    def _push_log(self, text: str) -> None:
+        self._log_lock.lock()
+        try:
+            was_empty = not self._log_buf
+            self._log_buf.append(text)
+        finally:
+            self._log_lock.unlock()
+        if was_empty:
+            self.logs_available.emit()
 
+    @Slot()
+    def run_loop(self) -> None:
+        uploader = TaskUploader()
         try:
-            self.uploader.upload(self.task, emit_log)
-            self.finished.emit(self.task, True, "上传成功")
-        except Exception as exc:
-            self.finished.emit(self.task, False, str(exc))
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                name = task.display_name()
+
+                def emit_log(message: str) -> None:
+                    # 时间戳在产生时记录，批量刷新不会改变日志时间
+                    self._push_log(f"[{datetime.now().strftime('%H:%M:%S')}] {name} · {message}")
+
+                emit_log("开始执行上传")
+                try:
+                    uploader.upload(task, emit_log)
+                    self.finished.emit(task, True, "上传成功")
+                except Exception as exc:
+                    self.finished.emit(task, False, str(exc))
+                finally:
+                    # 只关掉上一个任务遗留的页面，浏览器和登录上下文留给下一个任务
+                    uploader.reset_page()
+        finally:
+            uploader.close()
 
 
 class TaskDetailWidget(QWidget):
@@ -61,12 +138,19 @@ class TaskDetailWidget(QWidget):
     upload_requested = Signal(Task)
     OWNER_TYPE_OPTIONS = list(OWNER_TYPE_ID_OPTIONS.keys())
     SUBMIT_ROLES = ["代理人", "申请人"]
+    OWNER_ROW_POOL_LIMIT = 32
 
     def __init__(self):
         super().__init__()
         self.current_task: Task | None = None
         self.owner_rows: list[dict[str, QWidget]] = []
+        # 移除的著作权人行先隐藏回收，切换任务时直接复用，避免反复创建/销毁控件
+        self._owner_row_pool: list[dict[str, QWidget]] = []
         self.meta_inputs: dict[str, dict[str, Any]] = {}
+        # (字段名, id(值)) -> (值, 格式化后的 JSON)；同时持有值本身，避免 id 被复用
+        self._meta_dump_cache: dict[tuple[str, int], tuple[Any, str]] = {}
+        # 用户改动过的表单区域："owners"、"login"、"role"、"meta:<字段名>"；同步时只处理这些
+        self._dirty: set[str] = set()
 
         main_layout = QVBoxLayout(self)
         self.status_label = QLabel("请选择任务")
@@ -96,6 +180,7 @@ class TaskDetailWidget(QWidget):
         self.login_username_input = QLineEdit()
         self.login_username_input.setPlaceholderText("请输入账号")
         self.login_username_input.setMinimumWidth(200)
+        self.login_username_input.textEdited.connect(functools.partial(self._mark_dirty, "login"))
         account_layout.addWidget(self.login_username_input, 0, 5)
 
         account_layout.addWidget(QLabel("版权中心登录密码"), 0, 6)
@@ -103,6 +188,7 @@ class TaskDetailWidget(QWidget):
         self.login_password_input.setPlaceholderText("请输入密码")
         self.login_password_input.setEchoMode(QLineEdit.Password)
         self.login_password_input.setMinimumWidth(200)
+        self.login_password_input.textEdited.connect(functools.partial(self._mark_dirty, "login"))
         account_layout.addWidget(self.login_password_input, 0, 7)
 
         account_layout.setColumnStretch(7, 1)
@@ -112,7 +198,8 @@ class TaskDetailWidget(QWidget):
         owners_header.addWidget(QLabel("著作权人配置"))
         owners_header.addStretch()
         self.add_owner_button = QPushButton("新增著作权人")
-        self.add_owner_button.clicked.connect(lambda: self._add_owner_row())
+        # clicked(bool) 的参数会落到 data 上，False 与 None 一样视为空行
+        self.add_owner_button.clicked.connect(self._add_owner_row)
         owners_header.addWidget(self.add_owner_button)
 
         self.owner_scroll = QScrollArea()
@@ -162,6 +249,7 @@ class TaskDetailWidget(QWidget):
             self._set_login_fields("机构", "", "")
             self._set_submit_role("代理人")
             self._set_enabled(False)
+            self._dirty.clear()
             return
 
         self._clear_owner_rows()
@@ -179,6 +267,10 @@ class TaskDetailWidget(QWidget):
         self._set_submit_role(str(task.config.get("submit_role", "代理人")))
         self.status_label.setText(f"状态：{task.status.name}")
         self._set_enabled(True)
+        self._dirty.clear()
+
+    def _mark_dirty(self, tag: str, *_args: Any) -> None:
+        self._dirty.add(tag)
 
     def _set_enabled(self, enabled: bool) -> None:
         self.save_button.setEnabled(enabled)
@@ -199,35 +291,36 @@ class TaskDetailWidget(QWidget):
     def _sync_task_from_form(self) -> bool:
         if not self.current_task:
             return True
-        owners: list[dict[str, str]] = []
-        if not self._should_hide_owner_section():
-            for row in self.owner_rows:
-                owners.append(
-                    {
-                        "name": row["name"].text().strip(),
-                        "card_input": row["card_input"].text().strip(),
-                        "province": row["province"].text().strip(),
-                        "city": row["city"].text().strip(),
-                        "name_type": row["name_type"].currentText().strip(),
-                        "id_type": row["id_type"].currentText().strip(),
-                    }
-                )
-        login_type = self.login_type_input.currentText().strip()
-        submit_role = self.submit_role_input.currentText().strip()
-        login_username = self.login_username_input.text().strip()
-        login_password = self.login_password_input.text().strip()
-        self.current_task.update_config(
-            {
-                "owners": owners,
-                "login_type": login_type,
-                "submit_role": submit_role,
-                "login_username": login_username,
-                "login_password": login_password,
-            }
-        )
+        dirty = self._dirty
+        config_updates: dict[str, Any] = {}
+        # 办理身份决定著作权人区域是否生效，因此 role 变化时两块都要重新读取
+        if "owners" in dirty or "role" in dirty:
+            owners: list[dict[str, str]] = []
+            if not self._should_hide_owner_section():
+                for row in self.owner_rows:
+                    owners.append(
+                        {
+                            "name": row["name"].text().strip(),
+                            "card_input": row["card_input"].text().strip(),
+                            "province": row["province"].text().strip(),
+                            "city": row["city"].text().strip(),
+                            "name_type": row["name_type"].currentText().strip(),
+                            "id_type": row["id_type"].currentText().strip(),
+                        }
+                    )
+            config_updates["owners"] = owners
+        if "login" in dirty or "role" in dirty:
+            config_updates["login_type"] = self.login_type_input.currentText().strip()
+            config_updates["submit_role"] = self.submit_role_input.currentText().strip()
+            config_updates["login_username"] = self.login_username_input.text().strip()
+            config_updates["login_password"] = self.login_password_input.text().strip()
+        if config_updates:
+            self.current_task.update_config(config_updates)
 
         meta_updates: dict[str, Any] = {}
         for key, payload in self.meta_inputs.items():
+            if f"meta:{key}" not in dirty:
+                continue
             widget = payload.get("widget")
             if isinstance(widget, QLineEdit):
                 meta_updates[key] = widget.text().strip()
@@ -239,16 +332,24 @@ class TaskDetailWidget(QWidget):
                         origin = payload.get("original_type")
                         meta_updates[key] = [] if origin is list else {}
                         continue
+                    # 内容没改过就直接复用上次的解析结果
+                    if text_value == payload.get("serialized"):
+                        meta_updates[key] = payload["parsed"]
+                        continue
                     try:
-                        meta_updates[key] = json.loads(text_value)
-                    except json.JSONDecodeError as exc:
+                        parsed = _loads_meta(text_value)
+                    except ValueError as exc:
                         QMessageBox.warning(self, "JSON 格式错误", f"{key} 字段解析失败：{exc}")
                         return False
+                    payload["serialized"] = text_value
+                    payload["parsed"] = parsed
+                    meta_updates[key] = parsed
                 else:
                     meta_updates[key] = text_value
         if meta_updates:
             self.current_task.meta.update(meta_updates)
 
+        dirty.clear()
         self.status_label.setText(f"状态：{self.current_task.status.name}")
         return True
 
@@ -274,24 +375,42 @@ class TaskDetailWidget(QWidget):
         for key, value in task.meta.items():
             widget: QWidget
             is_json_value = isinstance(value, (dict, list))
+            serialized = None
             if is_json_value:
-                editor = QPlainTextEdit(json.dumps(value, ensure_ascii=False, indent=2))
+                serialized = self._dump_meta_value(key, value)
+                editor = QPlainTextEdit(serialized)
                 editor.setMinimumWidth(600)
                 editor.setMinimumHeight(80)
                 editor.moveCursor(QTextCursor.Start)
                 editor.verticalScrollBar().setValue(editor.verticalScrollBar().minimum())
+                editor.textChanged.connect(functools.partial(self._mark_dirty, f"meta:{key}"))
                 widget = editor
             else:
                 editor = QLineEdit(str(value))
                 editor.setMinimumWidth(600)
                 editor.setCursorPosition(0)
+                editor.textEdited.connect(functools.partial(self._mark_dirty, f"meta:{key}"))
                 widget = editor
             self.meta_form.addRow(key, widget)
             self.meta_inputs[key] = {
                 "widget": widget,
                 "is_json": is_json_value,
                 "original_type": type(value),
+                "serialized": serialized,
+                "parsed": value,
             }
+
+    def _dump_meta_value(self, key: str, value: Any) -> str:
+        """json.dumps for a meta field, reused while the task keeps the same value object."""
+        cache_key = (key, id(value))
+        cached = self._meta_dump_cache.get(cache_key)
+        if cached is not None and cached[0] is value:
+            return cached[1]
+        text = _dumps_meta(value)
+        if len(self._meta_dump_cache) >= 256:
+            self._meta_dump_cache.clear()
+        self._meta_dump_cache[cache_key] = (value, text)
+        return text
 
     def _clear_meta_fields(self) -> None:
         while self.meta_form.count():
@@ -337,11 +456,13 @@ class TaskDetailWidget(QWidget):
         self._update_remove_buttons_state(owner_enabled)
 
     def _handle_login_type_changed(self, value: str) -> None:
+        self._dirty.add("login")
         self._apply_owner_section_state(self.save_button.isEnabled())
         if self.current_task:
             self._sync_task_from_form()
 
     def _handle_submit_role_changed(self, value: str) -> None:
+        self._dirty.add("role")
         self._apply_owner_section_state(self.save_button.isEnabled())
         if self.current_task:
             self._sync_task_from_form()
@@ -362,6 +483,16 @@ class TaskDetailWidget(QWidget):
 
     def _add_owner_row(self, data: dict[str, str] | None = None) -> None:
         data = data or {}
+        # 优先复用切换任务时回收的行，池子空了才新建控件
+        row = self._owner_row_pool.pop() if self._owner_row_pool else self._create_owner_row()
+        self._fill_owner_row(row, data)
+        self.owner_layout.addWidget(row["widget"])
+        row["widget"].show()
+        self._dirty.add("owners")
+        self.owner_rows.append(row)
+        self._update_remove_buttons_state()
+
+    def _create_owner_row(self) -> dict[str, QWidget]:
         row_widget = QWidget()
         row_layout = QHBoxLayout(row_widget)
         row_layout.setContentsMargins(0, 0, 0, 0)
@@ -369,35 +500,30 @@ class TaskDetailWidget(QWidget):
 
         name_input = QLineEdit()
         name_input.setPlaceholderText("著作权人姓名或名称")
-        name_input.setText(data.get("name", ""))
 
         name_type_input = QComboBox()
         name_type_input.addItems(self.OWNER_TYPE_OPTIONS)
-        preset_type = data.get("name_type") or DEFAULT_OWNER_TYPE
-        index = name_type_input.findText(preset_type, Qt.MatchExactly)
-        if index >= 0:
-            name_type_input.setCurrentIndex(index)
 
         id_type_input = QComboBox()
-        self._refresh_id_type_options(name_type_input.currentText(), id_type_input, data.get("id_type"))
-        name_type_input.currentTextChanged.connect(
-            lambda value, combo=id_type_input: self._refresh_id_type_options(value, combo)
-        )
+        name_type_input.currentTextChanged.connect(functools.partial(self._refresh_id_type_options, combo=id_type_input))
+        mark_owners = functools.partial(self._mark_dirty, "owners")
+        name_type_input.currentIndexChanged.connect(mark_owners)
+        id_type_input.currentIndexChanged.connect(mark_owners)
 
         card_input = QLineEdit()
         card_input.setPlaceholderText("证件号码")
-        card_input.setText(data.get("card_input", ""))
 
         province_input = QLineEdit()
         province_input.setPlaceholderText("所属省份")
-        province_input.setText(data.get("province", ""))
 
         city_input = QLineEdit()
         city_input.setPlaceholderText("所属城市")
-        city_input.setText(data.get("city", ""))
+
+        for line_edit in (name_input, card_input, province_input, city_input):
+            line_edit.textEdited.connect(mark_owners)
 
         remove_button = QPushButton("删除")
-        remove_button.clicked.connect(lambda: self._remove_owner_row(row_widget))
+        remove_button.clicked.connect(self._remove_owner_row)
 
         row_layout.addWidget(QLabel("著作权类型"))
         row_layout.addWidget(name_type_input, stretch=1)
@@ -413,46 +539,79 @@ class TaskDetailWidget(QWidget):
         row_layout.addWidget(city_input, stretch=1)
         row_layout.addWidget(remove_button)
 
-        self.owner_layout.addWidget(row_widget)
-        self.owner_rows.append(
-            {
-                "widget": row_widget,
-                "name": name_input,
-                "name_type": name_type_input,
-                "id_type": id_type_input,
-                "card_input": card_input,
-                "province": province_input,
-                "city": city_input,
-                "remove_button": remove_button,
-            }
-        )
-        self._update_remove_buttons_state()
+        return {
+            "widget": row_widget,
+            "name": name_input,
+            "name_type": name_type_input,
+            "id_type": id_type_input,
+            "card_input": card_input,
+            "province": province_input,
+            "city": city_input,
+            "remove_button": remove_button,
+        }
+
+    def _fill_owner_row(self, row: dict[str, QWidget], data: dict[str, str]) -> None:
+        """Load ``data`` into a new or recycled row without firing the dirty-tracking signals."""
+        name_type_input = row["name_type"]
+        name_type_input.blockSignals(True)
+        index = name_type_input.findText(data.get("name_type") or DEFAULT_OWNER_TYPE, Qt.MatchExactly)
+        name_type_input.setCurrentIndex(index if index >= 0 else 0)
+        name_type_input.blockSignals(False)
+        self._refresh_id_type_options(name_type_input.currentText(), row["id_type"], data.get("id_type"))
+        # setText 不会触发 textEdited，无需屏蔽信号
+        row["name"].setText(data.get("name", ""))
+        row["card_input"].setText(data.get("card_input", ""))
+        row["province"].setText(data.get("province", ""))
+        row["city"].setText(data.get("city", ""))
 
     def _refresh_id_type_options(self, owner_type: str, combo: QComboBox, preset: str | None = None) -> None:
         options = OWNER_TYPE_ID_OPTIONS.get(owner_type, OWNER_TYPE_ID_OPTIONS[DEFAULT_OWNER_TYPE])
         combo.blockSignals(True)
-        combo.clear()
-        combo.addItems(options)
+        # 证件类型列表没变时不重建，只按需切换选中项；变化时只增删差异项
+        if combo.property("current_options") != options:
+            keep = set(options)
+            for index in reversed(range(combo.count())):
+                if combo.itemText(index) not in keep:
+                    combo.removeItem(index)
+            for index, text in enumerate(options):
+                if index >= combo.count() or combo.itemText(index) != text:
+                    combo.insertItem(index, text)
+            if combo.count() != len(options):
+                # 原有选项顺序与新列表不一致时退回整表重建
+                combo.clear()
+                combo.addItems(options)
+            combo.setProperty("current_options", list(options))
         if preset and preset in options:
             combo.setCurrentText(preset)
         else:
             combo.setCurrentIndex(0)
         combo.blockSignals(False)
 
-    def _remove_owner_row(self, widget: QWidget) -> None:
-        for row in list(self.owner_rows):
-            if row["widget"] is widget:
+    @Slot()
+    def _remove_owner_row(self) -> None:
+        # 按发出信号的删除按钮找到所在行，不在每行闭包里捕获控件
+        button = self.sender()
+        for row in self.owner_rows:
+            if row["remove_button"] is button:
+                self._dirty.add("owners")
                 self.owner_rows.remove(row)
-                widget.setParent(None)
-                widget.deleteLater()
+                self._release_owner_row(row)
                 break
         self._update_remove_buttons_state()
 
     def _clear_owner_rows(self) -> None:
         while self.owner_rows:
-            row = self.owner_rows.pop()
-            row["widget"].setParent(None)
-            row["widget"].deleteLater()
+            self._release_owner_row(self.owner_rows.pop())
+
+    def _release_owner_row(self, row: dict[str, QWidget]) -> None:
+        widget = row["widget"]
+        self.owner_layout.removeWidget(widget)
+        if len(self._owner_row_pool) < self.OWNER_ROW_POOL_LIMIT:
+            widget.hide()
+            self._owner_row_pool.append(row)
+        else:
+            widget.setParent(None)
+            widget.deleteLater()
 
 
 class MainWindow(QMainWindow):
@@ -463,10 +622,12 @@ class MainWindow(QMainWindow):
         self.files_dir: Path | None = None
         self.loader: TaskLoader | None = None
         self.tasks: list[Task] = []
-        self.worker_threads: list[QThread] = []
-        self.active_workers: list[UploadWorker] = []
+        self.upload_thread: QThread | None = None
+        self.upload_worker: UploadWorker | None = None
         self.upload_queue: list[Task] = []
         self.current_upload_task: Task | None = None
+        # id(task) -> 列表项，状态变化时只改对应项的文字，不整表重建
+        self._task_items: dict[int, QListWidgetItem] = {}
 
         central = QWidget()
         layout = QHBoxLayout(central)
@@ -534,6 +695,19 @@ class MainWindow(QMainWindow):
         self.log_view.setReadOnly(True)
         right_panel.addWidget(self.log_view, stretch=1)
 
+        self._log_timer = QTimer(self)
+        self._log_timer.setSingleShot(True)
+        self._log_timer.setInterval(50)
+        self._log_timer.timeout.connect(self._flush_logs)
+
+        # data.json 的保存合并到 200ms 后执行，写文件放到单线程池里，保证按顺序落盘
+        self._persist_timer = QTimer(self)
+        self._persist_timer.setSingleShot(True)
+        self._persist_timer.setInterval(200)
+        self._persist_timer.timeout.connect(self._flush_persist)
+        self._persist_pool = QThreadPool(self)
+        self._persist_pool.setMaxThreadCount(1)
+
         self.detail_widget.set_task(None)
 
     def _choose_directory(self) -> None:
@@ -563,24 +737,60 @@ class MainWindow(QMainWindow):
             self.detail_widget.set_task(None)
 
     def _render_task_list(self) -> None:
+        """Rebuild the whole list; only needed when self.tasks is reloaded."""
+        self.list_widget.setUpdatesEnabled(False)
+        self.list_widget.blockSignals(True)
         self.list_widget.clear()
+        self._task_items.clear()
         for task in self.tasks:
             item = QListWidgetItem(self._format_task_label(task))
             item.setData(Qt.UserRole, task)
             self.list_widget.addItem(item)
+            self._task_items[id(task)] = item
+        self.list_widget.blockSignals(False)
+        self.list_widget.setUpdatesEnabled(True)
+
+    def _update_task_item(self, task: Task) -> QListWidgetItem | None:
+        item = self._task_items.get(id(task))
+        if item is not None:
+            label = self._format_task_label(task)
+            if item.text() != label:
+                item.setText(label)
+        return item
+
+    def _refresh_task_labels(self) -> None:
+        for task in self.tasks:
+            self._update_task_item(task)
 
     def _append_log(self, message: str) -> None:
+        # 先写出上传线程积压的日志，保证先后顺序
+        self._flush_logs()
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.log_view.appendPlainText(f"[{timestamp}] {message}")
         scrollbar = self.log_view.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
 
+    @Slot()
+    def _schedule_log_flush(self) -> None:
+        if not self._log_timer.isActive():
+            self._log_timer.start()
+
+    @Slot()
+    def _flush_logs(self) -> None:
+        if self.upload_worker is None:
+            return
+        batch = self.upload_worker.take_logs()
+        if not batch:
+            return
+        self.log_view.appendPlainText("\n".join(batch))
+        scrollbar = self.log_view.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
     def _clear_logs(self) -> None:
         self.log_view.clear()
 
     def closeEvent(self, event) -> None:
-        running = [thread for thread in self.worker_threads if thread.isRunning()]
-        if running:
+        if self.current_upload_task is not None:
             reply = QMessageBox.question(
                 self,
                 "退出确认",
@@ -591,10 +801,14 @@ class MainWindow(QMainWindow):
             if reply == QMessageBox.StandardButton.No:
                 event.ignore()
                 return
-        for thread in list(self.worker_threads):
-            if thread.isRunning():
-                thread.quit()
-                thread.wait()
+        if self.upload_thread is not None and self.upload_worker is not None:
+            self.upload_worker.stop()
+            self.upload_thread.quit()
+            self.upload_thread.wait()
+        if self._persist_timer.isActive():
+            self._persist_timer.stop()
+            self._flush_persist()
+        self._persist_pool.waitForDone()
         super().closeEvent(event)
 
     def _format_task_label(self, task: Task) -> str:
@@ -621,17 +835,11 @@ class MainWindow(QMainWindow):
         return True
 
     def _handle_config_saved(self, task: Task) -> None:
-        self._persist_state()
-        updated_row = None
-        for row in range(self.list_widget.count()):
-            item = self.list_widget.item(row)
-            if item and item.data(Qt.UserRole) is task:
-                item.setText(self._format_task_label(task))
-                updated_row = row
-                break
-        if updated_row is not None:
+        self._request_persist()
+        item = self._update_task_item(task)
+        if item is not None:
             self.list_widget.blockSignals(True)
-            self.list_widget.setCurrentRow(updated_row)
+            self.list_widget.setCurrentItem(item)
             self.list_widget.blockSignals(False)
         else:
             self._render_task_list()
@@ -658,7 +866,7 @@ class MainWindow(QMainWindow):
         if not self.detail_widget.sync_current_task():
             return
         self._propagate_login_credentials()
-        self._persist_state()
+        self._request_persist()
 
         if not self.tasks:
             QMessageBox.information(self, "提示", "暂无任务可上传，请先选择 ZIP 目录并扫描。")
@@ -725,27 +933,26 @@ class MainWindow(QMainWindow):
         task = self.upload_queue.pop(0)
         self.current_upload_task = task
         task.status = TaskStatus.UPLOADING
-        self._render_task_list()
         self._reselect_task(task)
-        self._persist_state()
+        self._request_persist()
         self._append_log(f"{task.display_name()} · 开始上传")
         self._update_delete_button(task)
 
-        thread = QThread()
-        # 每个任务独立创建 TaskUploader，避免跨线程复用 Playwright 对象
-        worker = UploadWorker(task, TaskUploader())
-        worker.moveToThread(thread)
-        thread.started.connect(worker.run)
-        worker.finished.connect(self._handle_upload_finished)
-        worker.finished.connect(thread.quit)
-        worker.finished.connect(worker.deleteLater)
-        worker.log.connect(self._append_log)
-        worker.finished.connect(lambda *args, w=worker: self._cleanup_worker(w))
-        thread.finished.connect(thread.deleteLater)
-        thread.finished.connect(lambda t=thread: self._cleanup_thread(t))
-        thread.start()
-        self.worker_threads.append(thread)
-        self.active_workers.append(worker)
+        self._ensure_upload_worker().submit(task)
+
+    def _ensure_upload_worker(self) -> UploadWorker:
+        """Start the long-lived upload thread on first use."""
+        if self.upload_worker is None:
+            thread = QThread(self)
+            worker = UploadWorker()
+            worker.moveToThread(thread)
+            thread.started.connect(worker.run_loop)
+            worker.finished.connect(self._handle_upload_finished)
+            worker.logs_available.connect(self._schedule_log_flush, Qt.QueuedConnection)
+            thread.start()
+            self.upload_thread = thread
+            self.upload_worker = worker
+        return self.upload_worker
 
     def _propagate_login_credentials(self) -> None:
         """Fill missing login credentials for all tasks using current form values."""
@@ -788,8 +995,8 @@ class MainWindow(QMainWindow):
                 }
             )
 
-        self._persist_state()
-        self._render_task_list()
+        self._request_persist()
+        self._refresh_task_labels()
         current = self.list_widget.currentItem()
         if current:
             self.detail_widget.set_task(current.data(Qt.UserRole))
@@ -817,8 +1024,8 @@ class MainWindow(QMainWindow):
             task.update_config({"owners": owners})
             applied += 1
 
-        self._persist_state()
-        self._render_task_list()
+        self._request_persist()
+        self._refresh_task_labels()
         current = self.list_widget.currentItem()
         if current:
             self.detail_widget.set_task(current.data(Qt.UserRole))
@@ -857,20 +1064,23 @@ class MainWindow(QMainWindow):
         except ValueError:
             pass
 
-        self._render_task_list()
+        removed = self._task_items.pop(id(task), None)
+        if removed is not None:
+            self.list_widget.blockSignals(True)
+            self.list_widget.takeItem(self.list_widget.row(removed))
+            self.list_widget.blockSignals(False)
         if self.tasks:
             self.list_widget.setCurrentRow(0)
             self.detail_widget.set_task(self.list_widget.item(0).data(Qt.UserRole))
         else:
             self.detail_widget.set_task(None)
-        self._persist_state()
+        self._request_persist()
         self._append_log(f"{task.display_name()} · 已删除（文件未删除）")
         self._update_delete_button(self.list_widget.currentItem().data(Qt.UserRole) if self.list_widget.currentItem() else None)
 
     def _handle_upload_finished(self, task: Task, success: bool, message: str) -> None:
         task.status = TaskStatus.COMPLETED if success else TaskStatus.FAILED
-        self._persist_state()
-        self._render_task_list()
+        self._request_persist()
         self._reselect_task(task)
         self.detail_widget.set_task(task)
 
@@ -887,12 +1097,9 @@ class MainWindow(QMainWindow):
         self._update_delete_button(self.list_widget.currentItem().data(Qt.UserRole) if self.list_widget.currentItem() else None)
 
     def _reselect_task(self, task: Task) -> None:
-        for row in range(self.list_widget.count()):
-            item = self.list_widget.item(row)
-            if item and item.data(Qt.UserRole) is task:
-                self.list_widget.setCurrentRow(row)
-                item.setText(self._format_task_label(task))
-                break
+        item = self._update_task_item(task)
+        if item is not None:
+            self.list_widget.setCurrentItem(item)
         self._update_delete_button(task)
 
     def _update_delete_button(self, task: Task | None) -> None:
@@ -906,7 +1113,11 @@ class MainWindow(QMainWindow):
         self.apply_all_button.setEnabled(bool(self.tasks))
         self.apply_owners_button.setEnabled(bool(self.tasks))
 
-    def _persist_state(self) -> None:
+    def _request_persist(self) -> None:
+        self._persist_timer.start()
+
+    @Slot()
+    def _flush_persist(self) -> None:
         if not self.files_dir:
             return
         payload = []
@@ -919,20 +1130,9 @@ class MainWindow(QMainWindow):
                     "meta": task.meta,
                 }
             )
-        output_path = self.files_dir / "data.json"
-        output_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    def _cleanup_thread(self, thread: QThread) -> None:
-        try:
-            self.worker_threads.remove(thread)
-        except ValueError:
-            pass
-
-    def _cleanup_worker(self, worker: UploadWorker) -> None:
-        try:
-            self.active_workers.remove(worker)
-        except ValueError:
-            pass
+        # 序列化在界面线程完成（拿到的是当下的快照），只把写文件交给后台
+        data = _dumps_json(payload)
+        self._persist_pool.start(functools.partial(_write_state_file, self.files_dir / "data.json", data))
 
 
 def run_gui() -> None:
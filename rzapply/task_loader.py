@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
-from zipfile import ZipFile
+from typing import BinaryIO, Dict, List
+from zipfile import ZipFile, ZipInfo
 
 from models import OWNER_REQUIRED_FIELDS, Task, TaskStatus
 
+# 解压后总大小超过该值时按文件并行解压；zlib 解压期间会释放 GIL，线程即可并行
+PARALLEL_EXTRACT_BYTES = 20 << 20
+_EXTRACT_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="unzip")
+
 
 class TaskLoader:
     """Loads software tasks from ZIP archives that contain a meta.json file."""
@@ -24,20 +29,31 @@ class TaskLoader:
         for zip_path in zip_paths:
             extract_dir = self._ensure_extracted(zip_path)
             meta = self._load_meta_from_extract(extract_dir) or self._load_meta_from_zip(zip_path)
-            config = self._build_initial_config(meta)
-            status = TaskStatus.CONFIGURED if self._is_config_complete(config) else TaskStatus.PENDING
-            tasks.append(
-                Task(
-                    zip_path=zip_path,
-                    extract_dir=extract_dir,
-                    meta=meta,
-                    config=config,
-                    status=status,
-                )
-            )
+            tasks.append(self._build_task(zip_path, extract_dir, meta))
 
         return tasks
 
+    def load_from_stream(self, fp: BinaryIO, filename: str) -> Task:
+        """Extract an already-open ZIP stream under files_dir without writing the archive itself to disk."""
+        zip_path = self.files_dir / Path(filename).name
+        extract_dir = self.files_dir / zip_path.stem
+        extract_dir.mkdir(parents=True, exist_ok=True)
+        with ZipFile(fp, "r") as archive:
+            self._extract_all(archive, extract_dir)
+            meta = self._load_meta_from_extract(extract_dir) or self._read_meta(archive)
+        return self._build_task(zip_path, extract_dir, meta)
+
+    def _build_task(self, zip_path: Path, extract_dir: Path, meta: Dict) -> Task:
+        config = self._build_initial_config(meta)
+        status = TaskStatus.CONFIGURED if self._is_config_complete(config) else TaskStatus.PENDING
+        return Task(
+            zip_path=zip_path,
+            extract_dir=extract_dir,
+            meta=meta,
+            config=config,
+            status=status,
+        )
+
     def _ensure_extracted(self, zip_path: Path) -> Path:
         """Extract the archive if needed and return the extraction directory."""
         target_dir = self.files_dir / zip_path.stem
@@ -45,10 +61,28 @@ class TaskLoader:
 
         if not any(target_dir.iterdir()):
             with ZipFile(zip_path, "r") as archive:
-                archive.extractall(target_dir)
+                self._extract_all(archive, target_dir)
 
         return target_dir
 
+    def _extract_all(self, archive: ZipFile, target_dir: Path) -> None:
+        """extractall, spreading members over _EXTRACT_POOL when the archive is large."""
+        members = archive.infolist()
+        if len(members) < 2 or sum(item.file_size for item in members) < PARALLEL_EXTRACT_BYTES:
+            archive.extractall(target_dir)
+            return
+
+        def _extract(member: ZipInfo) -> None:
+            try:
+                archive.extract(member, target_dir)
+            except FileExistsError:
+                # 另一个线程刚建好同一父目录，重试即可
+                archive.extract(member, target_dir)
+
+        # ZipFile 内部对共享文件句柄加锁，多个成员可以并发读取
+        for _ in _EXTRACT_POOL.map(_extract, members):
+            pass
+
     def _load_meta_from_extract(self, extract_dir: Path) -> Dict:
         """Look for meta.json under the extracted directory tree."""
         meta_path = next(extract_dir.rglob(self.metadata_filename), None)
@@ -62,13 +96,16 @@ class TaskLoader:
     def _load_meta_from_zip(self, zip_path: Path) -> Dict:
         """Fallback loader that reads meta.json directly from the archive."""
         with ZipFile(zip_path, "r") as archive:
-            for item in archive.infolist():
-                if item.filename.endswith(self.metadata_filename):
-                    with archive.open(item) as fp:
-                        try:
-                            return json.loads(fp.read().decode("utf-8"))
-                        except json.JSONDecodeError:
-                            return {}
+            return self._read_meta(archive)
+
+    def _read_meta(self, archive: ZipFile) -> Dict:
+        for item in archive.infolist():
+            if item.filename.endswith(self.metadata_filename):
+                with archive.open(item) as fp:
+                    try:
+                        return json.loads(fp.read().decode("utf-8"))
+                    except json.JSONDecodeError:
+                        return {}
         return {}
 
     def _build_initial_config(self, meta: Dict) -> Dict[str, List[Dict[str, str]]]:
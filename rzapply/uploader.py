@@ -37,12 +37,12 @@ DEFAULT_CERT_DETAIL_ADDRESS = DEFAULT_CERT_CONTACT_UNIT
 DEFAULT_CERT_POSTAL_CODE = "221300"
 DEFAULT_CERT_PHONE = "18168245213"
 
-def ensure_storage_state_file() -> bool:
+def ensure_storage_state_file(path: Path = STORAGE_STATE) -> bool:
     """Ensure the storage_state file exists, returning True if it already existed."""
-    AUTH_DIR.mkdir(parents=True, exist_ok=True)
-    if STORAGE_STATE.exists():
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
         return True
-    STORAGE_STATE.write_text("{}")
+    path.write_text("{}")
     return False
 
 
@@ -59,12 +59,17 @@ class TaskUploader:
         default_password: str | None = None,
         default_login_type: str | None = None,
         default_submit_role: str | None = None,
+        storage_state: Path = STORAGE_STATE,
+        storage_meta: Path = STORAGE_META,
     ):
         self.headless = headless
         self.default_username = default_username or os.environ.get("RZAPPLY_USERNAME", "Yf19942050676_")
         self.default_password = default_password or os.environ.get("RZAPPLY_PASSWORD", "Yf19942050676_")
         self.default_login_type = (default_login_type or os.environ.get("RZAPPLY_LOGIN_TYPE") or "机构").strip()
         self.default_submit_role = (default_submit_role or os.environ.get("RZAPPLY_SUBMIT_ROLE") or "申请人").strip()
+        # 多个实例并存时（如服务端的上传池）各自使用独立的登录态文件，避免互相覆盖
+        self.storage_state = storage_state
+        self.storage_meta = storage_meta
         self.last_login_username: str | None = None
         self.last_login_type: str | None = None
         self._playwright: Playwright | None = None
@@ -73,12 +78,44 @@ class TaskUploader:
 
     def upload(self, task: Task, log: LogFn = None) -> dict[str, Path | str | None]:
         self._log(log, f"开始上传：{task.display_name()}")
-        ensure_storage_state_file()
-        self._load_state_meta()
+        ensure_storage_state_file(self.storage_state)
+        if self._context is None:
+            # 已有上下文时 last_login_* 记录的就是该上下文登录的账号，不能再用文件里的值覆盖
+            self._load_state_meta()
         artifacts = self._run(task, log)
         self._log(log, "上传流程结束")
         return artifacts
 
+    def warm_up(self) -> None:
+        """Start Playwright and launch the browser ahead of upload().
+
+        Playwright's sync API is bound to the calling thread, so this must run on the
+        same thread that later calls upload().
+        """
+        self._ensure_playwright()
+        if not self._browser or not self._browser.is_connected():
+            self._browser = self._playwright.chromium.launch(headless=self.headless, args=["--start-maximized"])
+
+    def close(self) -> None:
+        """Close the browser and stop Playwright; call from the thread that used this uploader."""
+        self._close_context()
+        if self._playwright:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    def reset_page(self) -> None:
+        """Close pages left open by the previous task, keeping the browser and login context for reuse."""
+        if not self._context:
+            return
+        try:
+            for page in list(self._context.pages):
+                page.close()
+        except Exception:
+            pass
+
     def _ensure_playwright(self) -> None:
         if not self._playwright:
             self._playwright = sync_playwright().start()
@@ -100,11 +137,11 @@ class TaskUploader:
     def _load_state_meta(self) -> None:
         text: str | None = None
         try:
-            text = STORAGE_META.read_text(encoding="utf-8")
+            text = self.storage_meta.read_text(encoding="utf-8")
         except UnicodeDecodeError:
             # 兼容旧版本使用系统默认编码写入的文件，例如 Windows 上的 cp936
             try:
-                text = STORAGE_META.read_text()
+                text = self.storage_meta.read_text()
             except Exception:
                 text = None
         except FileNotFoundError:
@@ -129,8 +166,8 @@ class TaskUploader:
 
     def _save_state_meta(self, username: str, login_type: str) -> None:
         try:
-            STORAGE_META.parent.mkdir(parents=True, exist_ok=True)
-            STORAGE_META.write_text(
+            self.storage_meta.parent.mkdir(parents=True, exist_ok=True)
+            self.storage_meta.write_text(
                 json.dumps({"username": username, "login_type": login_type}, ensure_ascii=False),
                 encoding="utf-8",
             )
@@ -149,10 +186,13 @@ class TaskUploader:
                 need_new = True
         if need_new:
             self._log(log, "启动浏览器")
-            self._close_context()
-            self._ensure_playwright()
-            self._browser = self._playwright.chromium.launch(headless=self.headless, args=["--start-maximized"])
-            self._context = self._browser.new_context(storage_state=str(STORAGE_STATE), no_viewport=True)
+            # warm_up() 已提前启动浏览器但尚未创建上下文时直接复用
+            warmed = self._context is None and self._browser is not None and self._browser.is_connected()
+            if not warmed:
+                self._close_context()
+                self._ensure_playwright()
+                self._browser = self._playwright.chromium.launch(headless=self.headless, args=["--start-maximized"])
+            self._context = self._browser.new_context(storage_state=str(self.storage_state), no_viewport=True)
         page = self._context.new_page()
         return page, username, password, login_type, submit_role
 
@@ -171,7 +211,7 @@ class TaskUploader:
 
         if self._login_if_needed(self._context, page, username, password, login_type, log):
             self._log(log, "登录成功，保存 storage_state")
-            self._context.storage_state(path=str(STORAGE_STATE))
+            self._context.storage_state(path=str(self.storage_state))
             self.last_login_username = username
             self.last_login_type = login_type
 